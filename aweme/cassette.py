@@ -0,0 +1,156 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from pathlib import Path
+
+import httpx
+from furl import furl
+
+from aweme import console
+
+# the body is stored decoded, do not replay these headers
+SKIPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+class Cassette:
+    """
+    a directory of recorded traffic: `index.jsonl.gz` holds one line per
+    request with its url (without X-Bogus), status and headers, bodies are
+    stored gzipped and content addressed under `bodies/`.
+
+    replay serves the responses of each url in recorded order
+    and repeats the last one once they run out.
+    """
+
+    def __init__(self, path: Path, mode: str):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f'unknown cassette mode {mode}')
+        self.path, self.mode = Path(path), mode
+        self._lock = threading.Lock()
+        self._index = None
+        self._tapes: dict[str, deque] = defaultdict(deque)
+        if mode == 'record':
+            (self.path / 'bodies').mkdir(parents=True, exist_ok=True)
+        else:
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    @staticmethod
+    def key(method: str, url: str | httpx.URL) -> str:
+        url = furl(str(url))
+        url.args.pop('X-Bogus', None)
+        url.args = sorted(url.args.allitems())
+        return f'{method} {url}'
+
+    def _load(self):
+        index = self.path / 'index.jsonl.gz'
+        if not index.exists():
+            raise ValueError(f'no cassette found at {self.path}')
+        with gzip.open(index, 'rt') as fp:
+            for line in fp:
+                entry = json.loads(line)
+                self._tapes[entry['key']].append(entry)
+        console.log(f'replaying {sum(map(len, self._tapes.values()))} '
+                    f'responses from {self.path}', style='notice')
+
+    def _body_file(self, digest: str) -> Path:
+        return self.path / 'bodies' / f'{digest}.gz'
+
+    def record(self, request: httpx.Request, response: httpx.Response):
+        body = response.content
+        digest = hashlib.md5(body).hexdigest()
+        entry = {
+            'key': self.key(request.method, request.url),
+            'status': response.status_code,
+            'headers': [(k, v) for k, v in response.headers.multi_items()
+                        if k.lower() not in SKIPPED_HEADERS],
+            'body': digest,
+        }
+        with self._lock:
+            if not (body_file := self._body_file(digest)).exists():
+                body_file.write_bytes(gzip.compress(body, compresslevel=1))
+            if self._index is None:
+                self._index = gzip.open(self.path / 'index.jsonl.gz', 'at')
+            self._index.write(json.dumps(entry) + '\n')
+            self._index.flush()
+
+    def play(self, request: httpx.Request) -> httpx.Response:
+        key = self.key(request.method, request.url)
+        with self._lock:
+            if not (tape := self._tapes.get(key)):
+                raise ValueError(f'{key} is not recorded in {self.path}')
+            entry = tape.popleft() if len(tape) > 1 else tape[0]
+        body = gzip.decompress(self._body_file(entry['body']).read_bytes())
+        return httpx.Response(entry['status'], headers=entry['headers'],
+                              content=body, request=request)
+
+    def close(self):
+        with self._lock:
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, transport: httpx.BaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.cassette.replaying:
+            return self.cassette.play(request)
+        response = self.transport.handle_request(request)
+        response.read()
+        self.cassette.record(request, response)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette,
+                 transport: httpx.AsyncBaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    async def handle_async_request(
+            self, request: httpx.Request) -> httpx.Response:
+        if self.cassette.replaying:
+            return self.cassette.play(request)
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        self.cassette.record(request, response)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+_cassette: Cassette | None = None
+
+
+def use_cassette(path: Path, mode: str) -> Cassette:
+    """record or replay all traffic of transports created from now on"""
+    global _cassette
+    _cassette = Cassette(path, mode)
+    atexit.register(_cassette.close)
+    return _cassette
+
+
+def get_cassette() -> Cassette | None:
+    """
+    the active cassette, AWEME_CASSETTE=record:<dir> or replay:<dir>
+    activates one for the whole process
+    """
+    if _cassette is None and (env := os.environ.get('AWEME_CASSETTE')):
+        mode, _, path = env.partition(':')
+        use_cassette(Path(path).expanduser(), mode)
+    return _cassette
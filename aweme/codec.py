@@ -0,0 +1,47 @@
+import json
+import time
+
+import httpx
+
+from aweme.metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: bytes | str):
+    """decode json, with orjson when it is installed"""
+    start = time.perf_counter()
+    obj = orjson.loads(data) if orjson else json.loads(data)
+    metrics.stage('json_decode', 1, time.perf_counter() - start, len(data))
+    return obj
+
+
+def dumps(obj, sort_keys: bool = False) -> str:
+    """
+    encode json, sorting the keys of every nested dict on the way
+    instead of building a sorted copy first
+    """
+    start = time.perf_counter()
+    try:
+        if orjson is None:
+            raise TypeError
+        data = orjson.dumps(
+            obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+        nbytes, text = len(data), data.decode()
+    except TypeError:
+        # no orjson, or a value it refuses such as an int beyond 64 bits
+        text = json.dumps(obj, sort_keys=sort_keys)
+        nbytes = len(text)
+    metrics.stage('json_encode', 1, time.perf_counter() - start, nbytes)
+    return text
+
+
+def dumps_sorted(obj) -> str:
+    return dumps(obj, sort_keys=True)
+
+
+def response_json(r: httpx.Response):
+    return loads(r.content)
@@ -0,0 +1,412 @@
+import hashlib
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Iterable
+
+import httpx
+
+from aweme import console
+from aweme.fetcher import _Lazy, fetcher
+from aweme.metrics import metrics
+from aweme.retry import (
+    DOWNLOAD, FATAL_MEDIA_STATUS, check, policy, wait_breaker)
+from aweme.scheduler import Lane, bandwidth
+from aweme.session import UA
+from aweme.transport import get_transport
+from aweme.xmp import tag_media
+
+CHUNK_SIZE = 256 * 1024
+# the same media saved under another suffix counts as downloaded
+MEDIA_SUFFIXES = ('.webp', '.jpg', '.jpeg', '.png', '.heic', '.avif',
+                  '.mp4', '.mov')
+HEIF_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'hevc', b'mif1', b'msf1'}
+# files at least this large go to the video lane, small videos do not
+LARGE_FILE = 16 * 2**20
+LANES = {'image': 8, 'video': 3}
+
+sess: httpx.Client = _Lazy(lambda: httpx.Client(
+    follow_redirects=True, transport=get_transport('cdn')))
+
+
+def sniff_suffix(head: bytes) -> str | None:
+    """the file suffix by the magic bytes at the start of the file"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    if head[:3] == b'\xff\xd8\xff':
+        return '.jpg'
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return '.png'
+    if head[4:8] == b'ftyp':
+        if (brand := head[8:12]) in HEIF_BRANDS:
+            return '.heic'
+        if brand in (b'avif', b'avis'):
+            return '.avif'
+        return '.mov' if brand == b'qt  ' else '.mp4'
+
+
+def find_existing(img: Path) -> Path | None:
+    for suffix in {img.suffix, *MEDIA_SUFFIXES}:
+        if (path := img.with_suffix(suffix)).exists():
+            return path
+
+
+def _sidecar(part: Path) -> Path:
+    return part.with_name(part.name + '.json')
+
+
+def _md5_of(path: Path) -> tuple[int, 'hashlib._Hash']:
+    md5, size = hashlib.md5(), 0
+    with path.open('rb') as fp:
+        while chunk := fp.read(CHUNK_SIZE):
+            md5.update(chunk)
+            size += len(chunk)
+    return size, md5
+
+
+def _save_body(r: httpx.Response, part: Path, state: dict,
+               resume: bool) -> tuple[int, str]:
+    """write the body of r into part, appending to it on resume"""
+    if resume:
+        size, md5 = _md5_of(part)
+        console.log(f'resuming {part} from {size} bytes', style='dim')
+    else:
+        size, md5 = 0, hashlib.md5()
+    state |= {'etag': r.headers.get('ETag'),
+              'last_modified': r.headers.get('Last-Modified')}
+    with part.open('ab' if resume else 'wb') as fp:
+        for chunk in r.iter_bytes(CHUNK_SIZE):
+            if not size:
+                state['suffix'] = sniff_suffix(chunk)
+                _sidecar(part).write_text(json.dumps(state))
+            fp.write(chunk)
+            md5.update(chunk)
+            size += len(chunk)
+            bandwidth.consume(len(chunk))
+    return size, md5.hexdigest()
+
+
+def _stream_to(client: httpx.Client, url: str, part: Path, state: dict,
+               **kwargs) -> tuple[httpx.Response, int, str]:
+    """
+    stream the body into part, resuming it with a Range request when
+    part is left from an earlier try and the server validator is known.
+    Return the response with the size and md5 of the whole part file.
+    A part the server does not resume the way it was asked to is dropped
+    and downloaded again from the start.
+    """
+    headers = {'Accept-Encoding': 'identity'} | kwargs.get('headers', {})
+    offset = part.stat().st_size if part.exists() else 0
+    if offset and (validator := state.get('etag') or state.get(
+            'last_modified')):
+        headers |= {'Range': f'bytes={offset}-', 'If-Range': validator}
+    with client.stream('GET', url, **kwargs | {'headers': headers}) as r:
+        content_range = r.headers.get('Content-Range', '')
+        if r.status_code == 416 and 'Range' in headers and (
+                content_range == f'bytes */{offset}'
+                or state.get('filesize') == offset):
+            # the part holds every byte already
+            size, md5 = _md5_of(part)
+            return r, size, md5.hexdigest()
+        if (r.status_code == 206
+                and content_range.startswith(f'bytes {offset}-')):
+            return r, *_save_body(r, part, state, resume=True)
+        if r.status_code == 200:
+            return r, *_save_body(r, part, state, resume=False)
+        if r.status_code not in (206, 416) or 'Range' not in headers:
+            return r, 0, ''
+    console.log(f'{part}: {r.status_code} with Content-Range '
+                f'{content_range!r} for a resume from {offset} bytes, '
+                'downloading it again', style='error')
+    part.unlink()
+    return _stream_to(client, url, part, state, **kwargs)
+
+
+def download_single_file(
+        url: str,
+        filepath: Path,
+        filename: str,
+        xmp_info: dict = None,
+        filesize: int = None,
+        hash: str = None,
+        aweme_id: int = None,
+        sn: int = None,
+) -> dict:
+    """download url to filepath / filename, return its manifest entry"""
+    filepath.mkdir(parents=True, exist_ok=True)
+    img = filepath / filename
+    if existing := find_existing(img):
+        console.log(f'{existing} already exists..skipping...', style='info')
+        return {'path': str(existing), 'size': existing.stat().st_size,
+                'hash': None}
+    else:
+        console.log(f'downloading {img}...', style="dim")
+    part = img.with_name(img.name + '.part')
+    # what is needed to resume the download, kept next to the part file.
+    # url and xmp_info are not: signed urls expire and the tags are
+    # generated again from the post
+    state = dict(filename=filename, filesize=filesize, hash=hash,
+                 aweme_id=aweme_id, sn=sn)
+    if _sidecar(part).exists():
+        state |= json.loads(_sidecar(part).read_text())
+    attempt = 0
+    while True:
+        attempt += 1
+        time.sleep(wait_breaker(url, DOWNLOAD))
+        offset = part.stat().st_size if part.exists() else 0
+        start, r, size = time.perf_counter(), None, 0
+        try:
+            r, size, digest = _stream_to(
+                sess, url, part, state, headers={'User-Agent': UA})
+            if r.status_code == 404:
+                metrics.error(DOWNLOAD, 'HTTP404')
+                console.log(
+                    f"404 with normal fetch, using fetcher:{url}", style="info")
+                r, size, digest = _stream_to(
+                    fetcher.sess_main, url, part, state,
+                    follow_redirects=True)
+                metrics.slept('pause', 30)
+                time.sleep(30)
+            if r.status_code != 416:
+                r.raise_for_status()
+        except httpx.HTTPError as e:
+            # a try that got further than the last one is not a failure
+            # of the link, resume it right away
+            if part.exists() and part.stat().st_size > offset:
+                attempt = 0
+            delay = check(url, DOWNLOAD, max(attempt, 1),
+                          time.perf_counter() - start, e)
+        else:
+            delay = check(url, DOWNLOAD, attempt,
+                          time.perf_counter() - start, r=r, nbytes=size)
+        if delay is not None:
+            time.sleep(delay)
+            if r is not None and not size:
+                try:
+                    sess.get('https://www.douyin.com/',
+                             headers={'User-Agent': UA})
+                except httpx.HTTPError:
+                    pass
+            continue
+
+        # Content-Length counts the body of this response only, compare
+        # it with what was written to the part, not num_bytes_downloaded
+        # which a replayed response does not count
+        written = size - offset if r.status_code in (206, 416) else size
+        length = r.headers.get('Content-Length')
+        if length is not None and int(length) != written:
+            console.log(f"expected length: {length}, "
+                        f"actual length: {written} for {img}",
+                        style="error")
+            if attempt >= policy.max_tries:
+                raise ValueError(f'failed to download {url}')
+            console.log(f'retrying download for {img}')
+            continue
+        if (size, digest) != (filesize, hash) and (filesize or hash):
+            if r.status_code in (206, 416):
+                console.log(f'{img}: resumed file does not match, '
+                            'downloading it again', style='error')
+                part.unlink()
+                continue
+            console.log(f"expected size and hash: {filesize}, {hash}, "
+                        f"actual: {size}, {digest} for {img}",
+                        style="error")
+
+        if (suffix := state.get('suffix')) and suffix != img.suffix:
+            console.log(f'{img}: content is {suffix}, saving as such',
+                        style='info')
+            img = img.with_suffix(suffix)
+        os.replace(part, img)
+        _sidecar(part).unlink(missing_ok=True)
+
+        if xmp_info:
+            tag_media(img, xmp_info)
+        return {'path': str(img), 'size': size, 'hash': digest}
+
+
+def resume_partials(download_dir: Path, posts, manifest=None):
+    """
+    finish the downloads left as .part files by an earlier run, as far
+    as possible: url and tags come again from the post (model.Post), a
+    file which fails is left for the next run, or dropped once its url
+    is gone for good
+    """
+    sidecars = list(download_dir.rglob('*.part.json'))
+    if not sidecars:
+        return
+    console.log(f'resuming {len(sidecars)} unfinished downloads '
+                f'in {download_dir}', style='notice')
+    entries = []
+    for sidecar in sidecars:
+        part = sidecar.with_suffix('')
+        state = json.loads(sidecar.read_text())
+        try:
+            post = posts.get_or_none(id=state.get('aweme_id'))
+            img = post and next((m for m in post.medias(sidecar.parent)
+                                 if m['sn'] == state.get('sn')), None)
+            if img is None:
+                console.log(f'{part}: its post is unknown, dropping it',
+                            style='error')
+                part.unlink(missing_ok=True)
+                sidecar.unlink(missing_ok=True)
+                continue
+            img['filename'] = state['filename']
+            entry = download_single_file(**img)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in FATAL_MEDIA_STATUS:
+                console.log(f'{part}: {e.response.status_code}, '
+                            'leaving it for the next run', style='error')
+                continue
+            console.log(f'{part}: {e.response.status_code}, its url is gone, '
+                        'dropping it', style='error')
+            part.unlink(missing_ok=True)
+            sidecar.unlink(missing_ok=True)
+        except Exception as e:
+            console.log(f'{part}: {e!r}, leaving it for the next run',
+                        style='error')
+        else:
+            entries.append(entry | {'aweme_id': img['aweme_id'],
+                                    'sn': img['sn']})
+    if manifest is not None and entries:
+        manifest.record(entries)
+
+
+class DownloadStage:
+    """
+    download workers fed through bounded queues, so that homepage paging
+    blocks once enough files are waiting instead of running ahead.
+    Large files get a lane of their own, so that a few big videos do not
+    hold up hundreds of images. The first failed download cancels
+    everything still queued.
+    """
+
+    def __init__(self, lanes: dict[str, int] = None):
+        self.lanes = {name: Lane(name, workers)
+                      for name, workers in (lanes or LANES).items()}
+        self.cancelled = threading.Event()
+        self.error: Exception | None = None
+        self.entries: list[tuple[dict, dict]] = []
+        self.stats: dict[str, Counter] = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._threads = [
+            threading.Thread(target=self._work, args=(lane,), daemon=True)
+            for lane in self.lanes.values() for _ in range(lane.workers)]
+        for t in self._threads:
+            t.start()
+
+    def lane_of(self, img: dict) -> Lane:
+        size = img.get('filesize')
+        if size is None:
+            is_video = Path(img['filename']).suffix in ('.mp4', '.mov')
+            size = LARGE_FILE if is_video else 0
+        name = 'video' if size >= LARGE_FILE else 'image'
+        return self.lanes.get(name) or next(iter(self.lanes.values()))
+
+    def _work(self, lane: Lane):
+        while (img := lane.queue.get()) is not None:
+            if self.cancelled.is_set():
+                continue
+            lane.acquire()
+            if self.cancelled.is_set():
+                lane.release(0)
+                continue
+            start, nbytes = time.perf_counter(), 0
+            try:
+                entry = download_single_file(**img)
+            except Exception as e:
+                with self._lock:
+                    self.error = self.error or e
+                self.cancelled.set()
+                continue
+            else:
+                # files found on disk come without hash and cost no bytes
+                nbytes = entry['size'] if entry['hash'] else 0
+            finally:
+                lane.release(nbytes)
+            self.record(lane.name, 1, time.perf_counter() - start, nbytes)
+            with self._lock:
+                self.entries.append((img, entry))
+
+    def record(self, name: str, items: int, seconds: float, nbytes: int = 0):
+        metrics.stage(name, items, seconds, nbytes)
+        with self._lock:
+            self.stats[name].update(
+                items=items, seconds=seconds, bytes=nbytes)
+
+    def put(self, img: dict) -> bool:
+        """queue img, blocking while its lane is full, False if cancelled"""
+        lane = self.lane_of(img)
+        while not self.cancelled.is_set():
+            try:
+                lane.queue.put(img, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def join(self):
+        """wait for the queued downloads and log the throughput"""
+        for lane in self.lanes.values():
+            for _ in range(lane.workers):
+                lane.queue.put(None)
+        for t in self._threads:
+            t.join()
+        elapsed = time.perf_counter() - self._start
+        for name, stats in self.stats.items():
+            console.log(
+                f"{name}: {stats['items']} files, "
+                f"{stats['bytes'] / 2**20:.1f} MiB in "
+                f"{stats['seconds']:.1f}s of work "
+                f"({stats['items'] / (stats['seconds'] or 1):.2f} files/s)",
+                style='info')
+        console.log(f'download stage finished in {elapsed:.1f}s',
+                    style='info')
+
+
+def download_files(imgs: Iterable[dict], manifest=None,
+                   batch_size: int = 50, lanes: dict[str, int] = None):
+    """
+    download imgs while they are being paged. manifest (model.Media) is
+    asked in bulk which of each batch are downloaded already, and records
+    the rest
+    """
+    imgs = iter(imgs)
+    stage = DownloadStage(lanes)
+    try:
+        while not stage.cancelled.is_set():
+            start = time.perf_counter()
+            batch = list(itertools.islice(imgs, batch_size))
+            stage.record('page', len(batch), time.perf_counter() - start)
+            if not batch:
+                break
+            if manifest is not None:
+                done = manifest.downloaded(
+                    [(img['aweme_id'], img['sn']) for img in batch
+                     if img.get('aweme_id') is not None])
+                todo = [img for img in batch if (
+                    img.get('aweme_id'), img.get('sn')) not in done]
+                if skipped := len(batch) - len(todo):
+                    console.log(f'{skipped} files already downloaded '
+                                'by the manifest..skipping...', style='info')
+                batch = todo
+            for img in batch:
+                if not stage.put(img):
+                    break
+    except BaseException:
+        stage.cancelled.set()
+        raise
+    finally:
+        stage.join()
+        if manifest is not None:
+            manifest.record([
+                entry | {'aweme_id': img['aweme_id'], 'sn': img['sn']}
+                for img, entry in stage.entries
+                if img.get('aweme_id') is not None])
+    if stage.error is not None:
+        raise stage.error
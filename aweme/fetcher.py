@@ -1,68 +1,47 @@
-import hashlib
+import asyncio
+import itertools
 import json
 import logging
-import random
 import re
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
-from typing import Iterable
 from urllib.parse import unquote, urlencode
 
-import execjs
 import httpx
-from bs4 import BeautifulSoup
-from exiftool import ExifToolHelper
 from furl import furl
 from rich.prompt import Confirm
-from selenium import webdriver
 
 from aweme import console
+from aweme.cassette import get_cassette
+from aweme.httpcache import ResponseCache
+from aweme.metrics import metrics
+from aweme.pacer import PACING
+from aweme.retry import check, wait_breaker
+from aweme.session import UA, Account, SessionPool
+from aweme.signer import XBogusSigner
+from aweme.transport import discard_transport, get_transport
 
-UA = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 httpx_logger = logging.getLogger("httpx")
 httpx_logger.disabled = True
-
-
-def _get_session():
-    headers = {
-        "authority": "www.douyin.com",
-        "sec-ch-ua": '"Not_A Brand";v="8", "Chromium";v="120"',
-        "accept": "application/json, text/plain, */*",
-        "dnt": "1",
-        "sec-ch-ua-mobile": "?0",
-        "user-agent": UA,
-        "sec-ch-ua-platform": '"macOS"',
-        "sec-fetch-site": "same-origin",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-dest": "empty",
-        "referer": "https://www.douyin.com/user",
-        "accept-encoding": "gzip, deflate, br",
-        "accept-language": "en-US,en;q=0.9,zh-CN;q=0.8,zh;q=0.7",
-    }
-    cookie_file = Path(__file__).with_name('cookie.json')
-    if cookie_file.exists():
-        cookies = json.loads(cookie_file.read_text())
-    else:
-        cookies = {}
-    sess_main = httpx.Client(headers=headers, cookies=cookies.get('main'))
-    sess_alt = httpx.Client(headers=headers, cookies=cookies.get('alt'))
-    return sess_main, sess_alt
+QUERY_USER_URL = ('https://www.douyin.com/aweme/v1/web/query/user/'
+                  '?device_platform=webapp&aid=6383&version_code=170400')
+# seconds a verified login is trusted without checking it again
+LOGIN_TTL = 30 * 60
 
 
 class Fetcher:
-    def __init__(self):
-        self.sess_main, self.sess_alt = _get_session()
+    def __init__(self, pacing: str = PACING, strategy: str = 'lru'):
+        self.pool = SessionPool(pacing=pacing, strategy=strategy)
         self._alt_login = None
-        with Path(__file__).with_name('X-Bogus.js').open() as fp:
-            ENV_NODE_JS = Path(__file__).resolve().parent.parent
-            self.js_func = execjs.compile(
-                fp.read(), cwd=ENV_NODE_JS/'node_modules')
+        self.signer = XBogusSigner()
+        self.cache = ResponseCache()
         self.visits = 0
-        self._visit_count = 0
-        self._last_fetch = time.time()
         self.enable_pause = True
 
+    @property
+    def sess_main(self) -> httpx.Client:
+        return self.pool.main.client
+
     @property
     def alt_login(self):
         return self._alt_login
@@ -76,217 +55,279 @@ class Fetcher:
             f'fetcher: current logined as {nickname} (is_alt:{on})',
             style='green on dark_green')
 
-    def login(self, alt_login: bool = False):
-        session = self.sess_alt if alt_login else self.sess_main
+    def login(self, alt_login: bool = False) -> str:
+        accounts = self.pool.alts if alt_login else [self.pool.main]
+        return ', '.join(self._login(account) for account in accounts)
+
+    def _login(self, account: Account) -> str:
+        """
+        verify the account is logged in, the full /user/self page is only
+        parsed once for the nickname, later checks within LOGIN_TTL are
+        free and after it a cheap query/user/ probe is enough
+        """
+        if account.nickname:
+            if time.time() - account.verified_at < LOGIN_TTL:
+                return account.nickname
+            if self._query_uid(account):
+                account.verified_at = time.time()
+                return account.nickname
         while True:
             r = self.get('https://www.douyin.com/user/self',
-                         alt_login=alt_login)
-            soup = BeautifulSoup(unquote(r.text), 'html.parser')
-            for s in soup.find_all('script'):
-                if 'realname' not in str(s).lower():
-                    continue
-                ptn = r'<script .*>self.__pace_f.push\(\[1,"(.*)"\]\)</script>'
-                if m := re.search(ptn, str(s)):
+                         account=account)
+            ptn = r'<script[^>]*>self.__pace_f.push\(\[1,"(.*?)"\]\)</script>'
+            for m in re.finditer(ptn, unquote(r.text)):
+                if 'realname' in m.group(1).lower():
                     login_status = json.loads(m.group(1))['app']['user']
                     break
             else:
                 console.log(
-                    f'cookie expired, relogin...(alt_login={alt_login})',
+                    f'cookie expired, relogin...(account={account.name})',
                     style='error')
                 if not Confirm.ask('open browser to login?'):
                     raise ValueError('cookie expired')
-                self._set_cookie(session)
+                self._set_cookie(account)
                 continue
             assert login_status.pop('isLogin') is True
-            return login_status['info']['nickname']
+            account.nickname = login_status['info']['nickname']
+            account.verified_at = time.time()
+            return account.nickname
+
+    def _query_uid(self, account: Account) -> str | None:
+        """uid of the account, None if its cookie has expired"""
+        js = self.get(QUERY_USER_URL, account=account).json()
+        if (uid := js.get('user_uid')) and uid != '0':
+            return uid
 
-    def _set_cookie(self, session):
+    def _set_cookie(self, account: Account):
+        from selenium import webdriver
         browser = webdriver.Chrome()
         browser.get('https://www.douyin.com/')
-        input('press enter after login...')
-        session.cookies = {c['name']: c['value']
-                           for c in browser.get_cookies()}
+        input(f'press enter after login {account.name}...')
+        account.client.cookies = {c['name']: c['value']
+                                  for c in browser.get_cookies()}
         browser.quit()
-        cookie_file = Path(__file__).with_name('cookie.json')
-        cookies = dict(
-            main={c.name: c.value for c in self.sess_main.cookies.jar},
-            alt={c.name: c.value for c in self.sess_alt.cookies.jar})
-        cookie_file.write_text(json.dumps(cookies))
+        self.pool.save_cookies()
 
     def _get_xbogus(self, params: dict | str) -> str:
         assert 'X-Bogus' not in params, 'X-Bogus in params'
         if isinstance(params, dict):
             params = urlencode(params)
-        return self.js_func.call('sign', params, UA)
+        return self.signer.sign(params, UA)
 
-    def get(self, url: str | furl, params: dict = None,
-            alt_login: bool | None = None):
+    def _pick_account(self, alt_login: bool | None) -> Account:
         if alt_login is None:
             if self.alt_login is None:
                 raise ValueError('alt_login is not set')
             alt_login = self.alt_login
-        session = self.sess_alt if alt_login else self.sess_main
-        if self.enable_pause:
-            self._pause()
-        console.log(f'fetching {url}...', style='info')
+        return self.pool.pick(alt_login)
+
+    @property
+    def replaying(self) -> bool:
+        return (cassette := get_cassette()) is not None and cassette.replaying
+
+    def _cached(self, url: furl, kind: str) -> httpx.Response | None:
+        # recording and replaying cassettes should see every request
+        if get_cassette():
+            return
+        if r := self.cache.get(url, kind):
+            console.log(f'fetching {url} from cache...', style='info')
+            return r
+
+    def _sign_url(self, url: str | furl, params: dict = None) -> furl:
         url = furl(url)
         url.args |= params or {}
         url.args.pop('X-Bogus', None)
-        url.args['X-Bogus'] = self._get_xbogus(url.query.encode())
+        if not self.replaying:
+            url.args['X-Bogus'] = self._get_xbogus(url.query.encode())
+        return url
 
-        try_time = 0
-        while True:
+    def _store(self, url: furl, kind: str, r: httpx.Response):
+        if not get_cassette():
+            self.cache.put(url, kind, r)
+
+    def _get_steps(self, account: Account, url: furl, refresh: bool):
+        """
+        one get as the steps shared by Fetcher.get and AsyncFetcher.get,
+        which carry them out: yields ('cached', url, kind),
+        ('sleep', seconds), ('fetch', url) and ('store', url, kind, r),
+        is sent the result of each and thrown the error of a fetch
+        """
+        kind = 'alt' if account.is_alt else 'main'
+        if not refresh and (r := (yield 'cached', url, kind)):
+            return r
+        if self.enable_pause and not self.replaying:
+            yield 'sleep', self._reserve_slot(account)
+        console.log(f'fetching {url}...', style='info')
+        url = self._sign_url(url)
+
+        for attempt in itertools.count(1):
+            yield 'sleep', wait_breaker(url)
+            start = time.perf_counter()
             try:
-                r = session.get(str(url))
+                r = yield 'fetch', url
                 r.raise_for_status()
-            except (httpx.ConnectTimeout, httpx.ConnectTimeout):
-                console.log('seems offline...sleep 10 secs', style='error')
-                time.sleep(10)
-            except httpx.PoolTimeout:
-                console.log('pool timeout... sleep 10 secs', style='error')
-                time.sleep(10)
             except httpx.HTTPError as e:
-                period = 60
-                try_time += 1
-                if try_time > 10:
-                    raise
-                console.log(
-                    f"{e}: Sleep {period} seconds and "
-                    f"retry [link={url}]{url}[/link] at {try_time}th times",
-                    style='error')
-                time.sleep(period)
+                delay = self._check(
+                    account, url, attempt, time.perf_counter() - start, e)
             else:
-                assert r.status_code == 200
-                return r
+                delay = self._check(
+                    account, url, attempt, time.perf_counter() - start, r=r)
+                if delay is None:
+                    assert r.status_code == 200
+                    yield 'store', url, kind, r
+                    return r
+            yield 'sleep', delay
 
-    def _pause(self):
-        self.visits += 1
-        if self._visit_count == 0:
-            self._visit_count = 1
-            self._last_fetch = time.time()
-            return
-        for flag in [2048, 1024, 256, 64, 32, 16]:
-            if self._visit_count % flag == 0:
-                sleep_time = flag * 2
-                break
-        else:
-            sleep_time = 4
-
-        sleep_time *= random.uniform(0.75, 1.25)
-        self._last_fetch += sleep_time
-        if (wait_time := (self._last_fetch-time.time())) > 0:
-            console.log(
-                f'sleep {wait_time:.1f} seconds...'
-                f'(count: {self._visit_count})',
-                style='info')
-        elif wait_time < -3600:
-            self._visit_count = 0
-            console.log(
-                f'reset visit count to {self._visit_count} since have '
-                f'no activity for {-wait_time:.1f} seconds, '
-                'which means more than 1 hour passed')
-        else:
-            console.log(
-                f'no sleeping since more than {sleep_time:.1f} seconds passed'
-                f'(count: {self._visit_count})')
-        while time.time() < self._last_fetch:
-            time.sleep(0.1)
-        self._last_fetch = time.time()
-        self._visit_count += 1
-
-
-fetcher = Fetcher()
-sess = httpx.Client(follow_redirects=True)
-
-
-def download_single_file(
-        url: str,
-        filepath: Path,
-        filename: str,
-        xmp_info: dict = None,
-        filesize: int = None,
-        hash: str = None,
-):
-    filepath.mkdir(parents=True, exist_ok=True)
-    img = filepath / filename
-    if img.exists():
-        console.log(f'{img} already exists..skipping...', style='info')
-        return
-    else:
-        console.log(f'downloading {img}...', style="dim")
-    for _ in range(10):
-        try:
-            r = sess.get(url, headers={'User-Agent': UA})
-        except httpx.HTTPError as e:
-            period = 60
-            console.log(
-                f"{e}: Sleepping {period} seconds and "
-                f"retry [link={url}]{url}[/link]...", style='error')
-            time.sleep(period)
-            continue
-
-        if r.status_code == 404:
-            console.log(
-                f"404 with normal fetch, using fetcher:{url}", style="info")
-            r = fetcher.sess_main.get(url, follow_redirects=True)
-            time.sleep(30)
-            assert r.status_code == 200
-        elif r.status_code != 200:
-            console.log(f"{url}, {r.status_code}", style="error")
-            time.sleep(15)
-            console.log(f'retrying download for {url}...')
-            continue
-
-        elif not r.content:
-            console.log(f"empty response for {url}", style="error")
-            time.sleep(15)
-            console.log(f'retrying download for {url}...')
+    def get(self, url: str | furl, params: dict = None,
+            alt_login: bool | None = None, account: Account = None,
+            refresh: bool = False):
+        """
+        fetch the signed url, responses of the endpoints listed in
+        httpcache.TTLS are served from cache unless refresh is True
+        """
+        account = account or self._pick_account(alt_login)
+        url = furl(url)
+        url.args |= params or {}
+        steps = self._get_steps(account, url, refresh)
+        result, error = None, None
+        while True:
             try:
-                sess.get('https://www.douyin.com/', headers={'User-Agent': UA})
-            except httpx.HTTPError:
-                pass
-            continue
-
-        if int(r.headers['Content-Length']) != len(r.content):
-            console.log(f"expected length: {r.headers['Content-Length']}, "
-                        f"actual length: {len(r.content)} for {img}",
-                        style="error")
-            console.log(f'retrying download for {img}')
-            continue
-        f, h = len(r.content), hashlib.md5(r.content).hexdigest()
-        if (f, h) != (filesize, hash) and (filesize or hash):
-            console.log(f"expected size and hash: {filesize}, {hash}, "
-                        f"actual: {f}, {h} for {img}",
-                        style="error")
-
-        img.write_bytes(r.content)
-
-        if xmp_info:
-            write_xmp(img, xmp_info)
-        break
-    else:
-        raise ValueError(f'failed to download {url}')
-
-
-def download_files(imgs: Iterable[dict]):
-    with ThreadPoolExecutor(max_workers=10) as pool:
-        futures = [pool.submit(download_single_file, **img) for img in imgs]
-    for future in futures:
-        future.result()
-
-
-def write_xmp(img: Path, tags: dict):
-    for k, v in tags.copy().items():
-        if isinstance(v, str):
-            tags[k] = v.replace('\n', '&#x0a;')
-    params = ['-overwrite_original', '-ignoreMinorErrors', '-escapeHTML']
-    with ExifToolHelper() as et:
-        ext = et.get_tags(img, 'File:FileTypeExtension')[
-            0]['File:FileTypeExtension'].lower()
-        if (suffix := f'.{ext}') != img.suffix:
-            new_img = img.with_suffix(suffix)
-            console.log(
-                f'{img}: suffix is not right, moving to {new_img}...',
-                style='error')
-            img = img.rename(new_img)
-        et.set_tags(img, tags, params=params)
+                step = steps.throw(error) if error else steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result, error = None, None
+            match step:
+                case 'cached', url, kind:
+                    result = self._cached(url, kind)
+                case 'sleep', seconds:
+                    if seconds > 0:
+                        time.sleep(seconds)
+                case 'fetch', url:
+                    try:
+                        result = account.client.get(str(url))
+                    except httpx.HTTPError as e:
+                        error = e
+                case 'store', url, kind, r:
+                    self._store(url, kind, r)
+
+    @staticmethod
+    def _check(account: Account, url: furl, attempt: int, latency: float,
+               error: httpx.HTTPError = None,
+               r: httpx.Response = None) -> float | None:
+        """
+        judge one attempt, return None if r is good,
+        otherwise seconds to wait before the next attempt
+        """
+        delay = check(url, str(url.path), attempt, latency, error, r)
+        if delay is None:
+            account.pacer.feedback(ok=True, latency=latency)
+        else:
+            account.pacer.feedback(ok=False)
+        return delay
+
+    def _reserve_slot(self, account: Account) -> float:
+        """reserve the next fetch slot and return seconds to wait for it"""
+        self.visits += 1
+        wait_time = account.pacer.reserve()
+        metrics.slept('pause', wait_time)
+        return wait_time
+
+
+class AsyncFetcher:
+    """
+    asyncio counterpart of Fetcher, sharing its accounts, signer and pacing,
+    with at most `max_inflight` requests in flight per account
+    """
+
+    def __init__(self, fetcher: Fetcher, max_inflight: int = 4):
+        self.fetcher = fetcher
+        self.max_inflight = max_inflight
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def _client(self, account: Account) -> httpx.AsyncClient:
+        if account.name not in self._clients:
+            self._clients[account.name] = httpx.AsyncClient(
+                headers=account.client.headers,
+                transport=get_transport('api', asynchronous=True))
+            self._semaphores[account.name] = asyncio.Semaphore(
+                self.max_inflight)
+        client = self._clients[account.name]
+        # _set_cookie may have replaced the cookies of sync client
+        client.cookies.jar = account.client.cookies.jar
+        return client
+
+    async def get(self, url: str | furl, params: dict = None,
+                  alt_login: bool | None = None, account: Account = None,
+                  refresh: bool = False):
+        """
+        Fetcher.get without blocking the event loop, the cache is read
+        and written in a thread
+        """
+        fetcher = self.fetcher
+        account = account or fetcher._pick_account(alt_login)
+        client = self._client(account)
+        url = furl(url)
+        url.args |= params or {}
+        steps = fetcher._get_steps(account, url, refresh)
+        result, error = None, None
+        async with self._semaphores[account.name]:
+            while True:
+                try:
+                    step = (steps.throw(error) if error
+                            else steps.send(result))
+                except StopIteration as stop:
+                    return stop.value
+                result, error = None, None
+                match step:
+                    case 'cached', url, kind:
+                        result = await asyncio.to_thread(
+                            fetcher._cached, url, kind)
+                    case 'sleep', seconds:
+                        if seconds > 0:
+                            await asyncio.sleep(seconds)
+                    case 'fetch', url:
+                        try:
+                            result = await client.get(str(url))
+                        except httpx.HTTPError as e:
+                            error = e
+                    case 'store', url, kind, r:
+                        await asyncio.to_thread(fetcher._store, url, kind, r)
+
+    async def aclose(self):
+        """
+        close the clients and forget them with their semaphores, which
+        are bound to this event loop, so a later loop starts afresh
+        """
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        self._semaphores.clear()
+        # the clients closed the shared transport with them
+        discard_transport('api', asynchronous=True)
+
+
+class _Lazy:
+    """build the wrapped object on first attribute access"""
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_obj', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _get(self):
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    object.__setattr__(self, '_obj', self._factory())
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
+
+
+fetcher: Fetcher = _Lazy(Fetcher)
+afetcher: AsyncFetcher = _Lazy(lambda: AsyncFetcher(fetcher._get()))
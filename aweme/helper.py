@@ -1,17 +1,41 @@
-import itertools
-
-from geopy.distance import geodesic
+import functools
+import math
 
 from aweme import console
 
 
-def sort_dict(d):
-    if isinstance(d, dict):
-        return {k: sort_dict(v) if isinstance(v, (dict, list)) else v for k, v in sorted(d.items())}
-    elif isinstance(d, list):
-        return [sort_dict(item) if isinstance(item, (dict, list)) else item for item in d]
-    else:
-        return d
+# WGS84
+_A = 6378137.0
+_E2 = 6.69437999014e-3
+# rounding errors this close to the tolerance are settled by geodesic
+_AMBIGUOUS = 1e-6
+
+
+def _band(tolerance: float) -> float:
+    return max(_AMBIGUOUS, 10 * tolerance / _A) * tolerance
+
+
+def _metres_per_degree(lat, xp=math):
+    """
+    metres per degree of latitude and of longitude at lat,
+    with xp=numpy for arrays of latitudes
+    """
+    rad = xp.radians(lat)
+    w = xp.sqrt(1 - _E2 * xp.sin(rad) ** 2)
+    return (xp.radians(_A * (1 - _E2) / w ** 3),
+            xp.radians(_A / w * xp.cos(rad)))
+
+
+def _rounding_err(lat: float, lng: float, lat_: float, lng_: float) -> float:
+    """metres between a point and a point centimetres away"""
+    my, mx = _metres_per_degree((lat + lat_) / 2)
+    return math.hypot((lat_ - lat) * my, (lng_ - lng) * mx)
+
+
+def max_precision(lat: float, tolerance: float = 0.01) -> int:
+    """decimals that keep any point at lat within tolerance meter"""
+    my, mx = _metres_per_degree(lat)
+    return max(1, math.floor(math.log10(math.hypot(my, mx) / tolerance)) + 1)
 
 
 def round_loc(lat: float | str, lng: float | str,
@@ -19,11 +43,26 @@ def round_loc(lat: float | str, lng: float | str,
     """
     return rounded location with err small than tolerance meter
     """
-    lat, lng = float(lat), float(lng)
+    return _round_loc(float(lat), float(lng), tolerance)
+
+
+@functools.lru_cache(maxsize=65536)
+def _round_loc(lat: float, lng: float, tolerance: float):
+    """
+    the fewest decimals with err < tolerance, again from the rounded
+    point until it stays put. The errors are measured on the ellipsoid
+    around the point, precise to far below a millimetre at this scale,
+    and at most max_precision decimals are tried.
+    """
+    band = _band(tolerance)
     while True:
-        for precision in itertools.count(start=1):
+        for precision in range(1, max_precision(lat, tolerance) + 1):
             lat_, lng_ = round(lat, precision), round(lng, precision)
-            if (err := geodesic((lat, lng), (lat_, lng_)).meters) < tolerance:
+            err = _rounding_err(lat, lng, lat_, lng_)
+            if abs(err - tolerance) <= band:
+                from geopy.distance import geodesic
+                err = geodesic((lat, lng), (lat_, lng_)).meters
+            if err < tolerance:
                 break
         if err:
             console.log(
@@ -35,6 +74,70 @@ def round_loc(lat: float | str, lng: float | str,
     return lat_, lng_
 
 
+def _two_product(np, a, b):
+    """a * b as p + e exactly (Dekker), for arrays of floats"""
+    def split(x):
+        c = 134217729.0 * x
+        hi = c - (c - x)
+        return hi, x - hi
+    p = a * b
+    (ah, al), (bh, bl) = split(a), split(b)
+    return p, al * bl - (((p - ah * bh) - al * bh) - ah * bl)
+
+
+def _np_round(np, x, precision: int):
+    """
+    round(x, precision) over an array: decide the last digit on the
+    exact value of x * 10**precision, ties to even, the way round() does
+    """
+    scale = 10.0 ** precision
+    t, e = _two_product(np, np.abs(x), scale)
+    k = np.floor(t)
+    k -= (t == k) & (e < 0)
+    # t - k is exact, and so is its distance to the half
+    d = t - k - 0.5
+    up = (d > 0) | ((d == 0) & ((e > 0) | ((e == 0) & (k % 2 == 1))))
+    return np.copysign((k + up) / scale, x)
+
+
+def round_locs(lats, lngs, tolerance: float = 0.01):
+    """
+    round_loc over arrays of coordinates at once, e.g. to re-round
+    the Location table, returns arrays of latitudes and longitudes.
+    Each pass only works on the points not settled yet, the few close
+    to the tolerance are left to round_loc and its geodesic.
+    """
+    import numpy as np
+    lat = np.array(lats, dtype=float)
+    lng = np.array(lngs, dtype=float)
+    lat0, lng0, band = lat.copy(), lng.copy(), _band(tolerance)
+    scale = np.hypot(*_metres_per_degree(lat, np))
+    top = int(np.floor(np.log10(scale.max() / tolerance))) + 1
+    slow = np.zeros(len(lat), dtype=bool)
+    moving = np.arange(len(lat))
+    while moving.size:
+        lat_, lng_ = lat[moving], lng[moving]
+        pending = np.arange(moving.size)
+        for precision in range(1, top + 1):
+            la, ln = lat[moving[pending]], lng[moving[pending]]
+            plat, plng = _np_round(np, la, precision), _np_round(
+                np, ln, precision)
+            my, mx = _metres_per_degree((la + plat) / 2, np)
+            err = np.hypot((plat - la) * my, (plng - ln) * mx)
+            slow[moving[pending]] |= np.abs(err - tolerance) <= band
+            # past top the last precision stands, as in round_loc
+            hit = (err < tolerance) | (precision == top)
+            lat_[pending[hit]], lng_[pending[hit]] = plat[hit], plng[hit]
+            if not (pending := pending[~hit]).size:
+                break
+        moved = (lat_ != lat[moving]) | (lng_ != lng[moving])
+        lat[moving], lng[moving] = lat_, lng_
+        moving = moving[moved]
+    for i in np.flatnonzero(slow):
+        lat[i], lng[i] = round_loc(lat0[i], lng0[i], tolerance)
+    return lat, lng
+
+
 DICT_CMP_USER = {
     'apple_account': 0,
     'aweme_count_correction_threshold': -1,
@@ -0,0 +1,114 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import httpx
+from furl import furl
+
+# seconds a cached response of each endpoint stays fresh,
+# endpoints not listed here are never cached
+TTLS = {
+    '/aweme/v1/web/user/profile/other/': 30 * 60,
+    '/aweme/v1/web/aweme/detail/': 24 * 3600,
+}
+# query args which vary between calls without changing the response
+VOLATILE_ARGS = {'X-Bogus', 'msToken', 'webid'}
+# httpx has already decoded the body, do not replay these headers
+SKIPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+class ResponseCache:
+    """
+    sqlite backed cache of API responses, keyed by endpoint, normalized
+    query args and the kind of account (main or alt) which fetched it,
+    least recently used responses are evicted beyond `max_bytes`
+    """
+
+    def __init__(self, path: Path = None, max_bytes: int = 256 * 2**20,
+                 ttls: dict[str, int] = None):
+        if path is None:
+            path = Path.home() / '.cache' / 'aweme' / 'responses.sqlite'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = TTLS if ttls is None else ttls
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS response ('
+            'key TEXT PRIMARY KEY, endpoint TEXT, url TEXT, status INTEGER, '
+            'headers TEXT, body BLOB, size INTEGER, '
+            'fetched_at REAL, accessed_at REAL)')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS response_accessed '
+            'ON response (accessed_at)')
+        self._db.commit()
+
+    def ttl(self, url: furl) -> int | None:
+        return self.ttls.get(str(url.path))
+
+    @staticmethod
+    def key(url: furl, account_kind: str) -> str:
+        # furl keeps args as given, an int id is '1' once the url is copied
+        args = sorted((k, str(v)) for k, v in url.args.allitems()
+                      if k not in VOLATILE_ARGS)
+        return json.dumps([account_kind, str(url.path), args])
+
+    def get(self, url: furl, account_kind: str) -> httpx.Response | None:
+        if not (ttl := self.ttl(url)):
+            return
+        key = self.key(url, account_kind)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT status, headers, body, fetched_at FROM response '
+                'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return
+            status, headers, body, fetched_at = row
+            if now - fetched_at > ttl:
+                self._db.execute('DELETE FROM response WHERE key = ?', (key,))
+                self._db.commit()
+                return
+            self._db.execute(
+                'UPDATE response SET accessed_at = ? WHERE key = ?',
+                (now, key))
+            self._db.commit()
+        return httpx.Response(
+            status, headers=json.loads(headers), content=body,
+            request=httpx.Request('GET', str(url)))
+
+    def put(self, url: furl, account_kind: str, response: httpx.Response):
+        if not self.ttl(url):
+            return
+        headers = {k: v for k, v in response.headers.items()
+                   if k.lower() not in SKIPPED_HEADERS}
+        body = response.content
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO response VALUES (?,?,?,?,?,?,?,?,?)',
+                (self.key(url, account_kind), str(url.path), str(url),
+                 response.status_code, json.dumps(headers), body, len(body),
+                 now, now))
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total, = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM response').fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            'SELECT key, size FROM response ORDER BY accessed_at').fetchall()
+        for key, size in rows:
+            self._db.execute('DELETE FROM response WHERE key = ?', (key,))
+            if (total := total - size) <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM response')
+            self._db.commit()
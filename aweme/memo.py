@@ -0,0 +1,88 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class ParseCache:
+    """
+    parse results keyed by (cache id, updated_at, parser version), the
+    least recently used are dropped beyond `maxsize`. Given a path, the
+    results are kept in sqlite as well and survive restarts.
+    """
+
+    def __init__(self, maxsize: int = 4096, path: Path = None,
+                 max_rows: int = 200_000):
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self._memo: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            path = Path(path).expanduser()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS parsed ('
+                'key TEXT PRIMARY KEY, value BLOB, accessed_at REAL)')
+            self._db.execute(
+                'CREATE INDEX IF NOT EXISTS parsed_accessed '
+                'ON parsed (accessed_at)')
+            self._db.commit()
+
+    @staticmethod
+    def _dbkey(key: tuple) -> str:
+        return '|'.join(map(str, key))
+
+    def get(self, key: tuple) -> dict | None:
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+            if self._db is None:
+                return
+            row = self._db.execute('SELECT value FROM parsed WHERE key = ?',
+                                   (self._dbkey(key),)).fetchone()
+            if row is None:
+                return
+            self._db.execute(
+                'UPDATE parsed SET accessed_at = ? WHERE key = ?',
+                (time.time(), self._dbkey(key)))
+            self._db.commit()
+            value = pickle.loads(row[0])
+            self._remember(key, value)
+            return value
+
+    def put(self, key: tuple, value: dict):
+        with self._lock:
+            self._remember(key, value)
+            if self._db is None:
+                return
+            self._db.execute(
+                'INSERT OR REPLACE INTO parsed VALUES (?,?,?)',
+                (self._dbkey(key), pickle.dumps(value), time.time()))
+            self._db.execute(
+                'DELETE FROM parsed WHERE key IN (SELECT key FROM parsed '
+                'ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_rows,))
+            self._db.commit()
+
+    def _remember(self, key: tuple, value: dict):
+        self._memo[key] = value
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.maxsize:
+            self._memo.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM parsed')
+                self._db.commit()
+
+
+# AWEME_PARSE_CACHE=<sqlite file> keeps parse results across runs
+parse_cache = ParseCache(path=os.environ.get('AWEME_PARSE_CACHE'))
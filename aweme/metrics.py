@@ -0,0 +1,138 @@
+import bisect
+import json
+import threading
+from collections import Counter, defaultdict
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf'))
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': {str(b): c for b, c in zip(self.buckets, self.counts)},
+        }
+
+
+class Metrics:
+    """
+    per endpoint request counts, latencies, bytes, errors and retries,
+    plus the seconds spent sleeping (pacing, retrying) and on the wire
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency: dict[str, Histogram] = defaultdict(Histogram)
+            self.requests = Counter()
+            self.bytes = Counter()
+            self.errors: dict[str, Counter] = defaultdict(Counter)
+            self.retries = Counter()
+            self.sleep = Counter()
+            self.wire = 0.0
+            self.stages: dict[str, Counter] = defaultdict(Counter)
+
+    def observe(self, endpoint: str, latency: float, nbytes: int):
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.latency[endpoint].observe(latency)
+            self.bytes[endpoint] += nbytes
+            self.wire += latency
+
+    def error(self, endpoint: str, error: str | Exception,
+              latency: float = 0):
+        if isinstance(error, Exception):
+            error = type(error).__name__
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.errors[endpoint][error] += 1
+            self.wire += latency
+
+    def retry(self, endpoint: str):
+        with self._lock:
+            self.retries[endpoint] += 1
+
+    def slept(self, reason: str, seconds: float):
+        with self._lock:
+            self.sleep[reason] += seconds
+
+    def stage(self, name: str, items: int, seconds: float, nbytes: int = 0):
+        """items passed through a pipeline stage in seconds of work"""
+        with self._lock:
+            self.stages[name].update(
+                items=items, seconds=seconds, bytes=nbytes)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'bytes': dict(self.bytes),
+                'errors': {k: dict(v) for k, v in self.errors.items()},
+                'retries': dict(self.retries),
+                'latency': {k: h.snapshot() for k, h in self.latency.items()},
+                'sleep_seconds': dict(self.sleep),
+                'wire_seconds': self.wire,
+                'stages': {k: dict(v) for k, v in self.stages.items()},
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        lines = [
+            '# TYPE aweme_requests_total counter',
+            *(f'aweme_requests_total{{endpoint="{e}"}} {v}'
+              for e, v in snap['requests'].items()),
+            '# TYPE aweme_bytes_total counter',
+            *(f'aweme_bytes_total{{endpoint="{e}"}} {v}'
+              for e, v in snap['bytes'].items()),
+            '# TYPE aweme_errors_total counter',
+            *(f'aweme_errors_total{{endpoint="{e}",error="{err}"}} {v}'
+              for e, errs in snap['errors'].items()
+              for err, v in errs.items()),
+            '# TYPE aweme_retries_total counter',
+            *(f'aweme_retries_total{{endpoint="{e}"}} {v}'
+              for e, v in snap['retries'].items()),
+            '# TYPE aweme_sleep_seconds_total counter',
+            *(f'aweme_sleep_seconds_total{{reason="{r}"}} {v}'
+              for r, v in snap['sleep_seconds'].items()),
+            '# TYPE aweme_wire_seconds_total counter',
+            f'aweme_wire_seconds_total {snap["wire_seconds"]}',
+            '# TYPE aweme_request_seconds histogram',
+        ]
+        for e, h in snap['latency'].items():
+            cumulative = 0
+            for b, c in h['buckets'].items():
+                cumulative += c
+                le = '+Inf' if b == 'inf' else b
+                lines.append(f'aweme_request_seconds_bucket'
+                             f'{{endpoint="{e}",le="{le}"}} {cumulative}')
+            lines.append(
+                f'aweme_request_seconds_sum{{endpoint="{e}"}} {h["sum"]}')
+            lines.append(
+                f'aweme_request_seconds_count{{endpoint="{e}"}} {h["count"]}')
+        for k in ('items', 'seconds', 'bytes'):
+            lines.append(f'# TYPE aweme_stage_{k}_total counter')
+            lines += [f'aweme_stage_{k}_total{{stage="{name}"}} {v.get(k, 0)}'
+                      for name, v in snap['stages'].items()]
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -3,8 +3,7 @@ from pathlib import Path
 from typing import Iterator, Self
 
 import pendulum
-from peewee import Model
-from photosinfo.model import GirlSearch
+from peewee import CompositeKey, Model, Node, Tuple
 from playhouse.postgres_ext import (
     ArrayField,
     BigIntegerField,
@@ -20,12 +19,43 @@ from playhouse.shortcuts import model_to_dict, update_model_from_dict
 from rich.prompt import Confirm
 
 from aweme import console
-from aweme.fetcher import download_files, fetcher
+from aweme.codec import dumps, dumps_sorted
+from aweme.download import download_files
+from aweme.fetcher import fetcher
+from aweme.memo import parse_cache
 from aweme.page import Page
-from aweme.post import get_aweme, parse_aweme
+from aweme.post import PARSER_VERSION, get_aweme, parse_aweme
+from aweme.schema import STRICT
 from aweme.user import get_user
 
-database = PostgresqlExtDatabase("aweme", host="localhost")
+
+class Database(PostgresqlExtDatabase):
+    """connect on first query and make sure the tables exist"""
+
+    def _initialize_connection(self, conn):
+        super()._initialize_connection(conn)
+        try:
+            init_db()
+        except Exception:
+            # drop the connection, so that the next query connects and
+            # bootstraps again
+            self._close(conn)
+            self._state.reset()
+            raise
+
+
+database = Database("aweme", host="localhost")
+_db_initialized = False
+
+
+def init_db():
+    """create the tables once per process, again if it failed"""
+    global _db_initialized
+    if _db_initialized:
+        return
+    database.create_tables(
+        [User, UserConfig, Artist, Post, Cache, Location, Media])
+    _db_initialized = True
 
 
 class BaseModel(Model):
@@ -50,6 +80,20 @@ class BaseModel(Model):
         return super().get(*query, **filters)
 
 
+class CodecJSONField(JSONField):
+    """json column encoded by aweme.codec, with sorted keys if sort_keys"""
+
+    def __init__(self, sort_keys=False, **kwargs):
+        self.sort_keys = sort_keys
+        super().__init__(**kwargs)
+
+    def db_value(self, value):
+        if value is None or isinstance(value, (Node, self.json_type)):
+            return value
+        return self.json_type(
+            value, dumps=dumps_sorted if self.sort_keys else dumps)
+
+
 class User(BaseModel):
     id = BigIntegerField(primary_key=True)
     sec_uid = CharField(unique=True)
@@ -91,12 +135,26 @@ class User(BaseModel):
     mix_count = IntegerField()
     secret = IntegerField()
     new_friend_type = IntegerField()
-    unknown_fields = JSONField(null=True)
-    search_result = GirlSearch.get_search_results()['awe']
+    unknown_fields = CodecJSONField(null=True)
     redirect = BigIntegerField(null=True)
 
+    _search_result: dict[str, str] = None
+
+    @classmethod
+    def search_result(cls) -> dict[str, str]:
+        """sec_uid => username found by photosinfo, loaded on first use"""
+        if cls._search_result is None:
+            from photosinfo.model import GirlSearch
+            cls._search_result = GirlSearch.get_search_results()['awe']
+        return cls._search_result
+
     @classmethod
-    def from_id(cls, user_id: str | int, update=False) -> Self:
+    def from_id(cls, user_id: str | int, update=False,
+                refresh=False) -> Self:
+        """
+        update fetches the profile again instead of returning the saved
+        user, from the response cache unless refresh is also set
+        """
         if isinstance(user_id, int) or user_id.isdigit():
             model = cls.get_or_none(id=user_id)
         else:
@@ -104,8 +162,9 @@ class User(BaseModel):
             model = cls.get_or_none(sec_uid=user_id)
         if model and not update:
             return model
-        for _ in range(3):
-            user_dict = get_user(user_id)
+        for i in range(3):
+            # the retries re-checking the following status bypass the cache
+            user_dict = get_user(user_id, refresh=refresh or i > 0)
             if not model or user_dict['following'] == model.following:
                 break
         else:
@@ -122,18 +181,17 @@ class User(BaseModel):
     @classmethod
     def upsert(cls, user_dict: dict) -> Self:
         user_id = user_dict['id']
-        unknown = {}
+        unknown = dict(user_dict.pop('unknown_fields', None) or {})
         for k in (set(user_dict) - set(cls._meta.columns)):
             unknown[k] = user_dict.pop(k)
         if unknown:
             console.log(
                 f'find unknow fields: {unknown}', style='info')
-        assert 'unknown_fields' not in user_dict
         user_dict['unknown_fields'] = unknown or None
 
         if not (model := cls.get_or_none(cls.id == user_id)):
             if 'username' not in user_dict:
-                if username := cls.search_result.get(user_dict['sec_uid']):
+                if username := cls.search_result().get(user_dict['sec_uid']):
                     user_dict['username'] = username
                 else:
                     user_dict['username'] = user_dict['nickname'].strip('-_')
@@ -208,8 +266,8 @@ class UserConfig(BaseModel):
         return super().__repr__()
 
     @classmethod
-    def from_id(cls, user_id: str | int) -> Self:
-        user = User.from_id(user_id, update=True)
+    def from_id(cls, user_id: str | int, refresh=False) -> Self:
+        user = User.from_id(user_id, update=True, refresh=refresh)
         user_dict = model_to_dict(user)
         user_dict['user_id'] = user_dict.pop('id')
         to_insert = {k: v for k, v in user_dict.items()
@@ -280,7 +338,7 @@ class UserConfig(BaseModel):
         console.log(f"Media Saving: {download_dir}")
         now = pendulum.now()
         imgs = self._save_aweme(download_dir)
-        download_files(imgs)
+        download_files(imgs, manifest=Media)
         console.log(f"{self.username}抖音获取完毕！")
         if self.aweme_fetch_at is None:
             self.aweme_first_fetch = now
@@ -389,7 +447,7 @@ class Artist(BaseModel):
     def from_id(cls, user_id: int, update: bool = False) -> Self:
         if not update and user_id in cls._cache:
             return cls._cache[user_id]
-        user = User.from_id(user_id, update=update)
+        user = User.from_id(user_id, update=update, refresh=update)
         user_dict = model_to_dict(user)
         user_dict['user_id'] = user_dict.pop('id')
         user_dict = {k: v for k, v in user_dict.items()
@@ -417,8 +475,8 @@ class Artist(BaseModel):
 class Cache(BaseModel):
     id = BigIntegerField(primary_key=True)
     user_id = BigIntegerField()
-    from_timeline = JSONField(null=True)
-    from_page = JSONField(null=True)
+    from_timeline = CodecJSONField(null=True, sort_keys=True)
+    from_page = CodecJSONField(null=True, sort_keys=True)
     blog_url = TextField()
     added_at = DateTimeTZField(null=True)
     updated_at = DateTimeTZField(null=True)
@@ -427,13 +485,22 @@ class Cache(BaseModel):
     def from_id(cls, aweme_id: int, update=False) -> dict:
         if not update and (cache := cls.get_or_none(id=aweme_id)):
             return cache.parse()
-        cache = get_aweme(aweme_id)
+        cache = get_aweme(aweme_id, refresh=update)
         cache = cls.upsert(cache)
         return cache.parse()
 
-    def parse(self):
-        self._check_parse()
+    def parse(self) -> dict:
+        key = (self.id, self.updated_at, PARSER_VERSION, STRICT)
+        if (aweme := parse_cache.get(key)) is None:
+            aweme = self._parse()
+            parse_cache.put(key, aweme)
+        # callers only add and remove top level keys
+        return dict(aweme)
+
+    def _parse(self) -> dict:
         aweme = parse_aweme(self.from_page or self.from_timeline)
+        if self.from_page and self.from_timeline and STRICT:
+            self._check_parse(aweme, parse_aweme(self.from_timeline))
         assert 'updated_at' not in aweme
         assert 'added_at' not in aweme
         if self.updated_at:
@@ -466,13 +533,12 @@ class Cache(BaseModel):
             row['added_at'] = pendulum.now()
             cls.insert(row).execute()
         cache = cls.get_by_id(aweme_id)
-        cache._check_parse()
+        cache.parse()
         return cache
 
-    def _check_parse(self):
-        if not (self.from_page and self.from_timeline):
-            return
-        d1, d2 = parse_aweme(self.from_page), parse_aweme(self.from_timeline)
+    @staticmethod
+    def _check_parse(d1: dict, d2: dict):
+        """cross check the parse results of from_page and from_timeline"""
         common_key = set(d1) & set(d2)
         if set(d1) != set(d2):
             if x := (set(d2) - common_key):
@@ -541,7 +607,7 @@ class Post(BaseModel):
     preview_video_status = IntegerField()
     group_id = BigIntegerField()
     comment_gid = BigIntegerField()
-    unknown_fields = JSONField(null=True)
+    unknown_fields = CodecJSONField(null=True)
     activity_video_type = IntegerField()
     added_at = DateTimeTZField(null=True)
     updated_at = DateTimeTZField(null=True)
@@ -564,13 +630,12 @@ class Post(BaseModel):
             aweme_dict |= loc_info
         id = aweme_dict['id']
         assert Cache.get_or_none(id=id)
-        unknown = {}
+        unknown = dict(aweme_dict.pop('unknown_fields', None) or {})
         for k in (set(aweme_dict) - set(cls._meta.columns)):
             unknown[k] = aweme_dict.pop(k)
         if unknown and not ignore_unknow:
             console.log(
                 f'find unknow fields: {unknown}', style='info')
-        assert 'unknown_fields' not in aweme_dict
         aweme_dict['unknown_fields'] = unknown or None
         aweme_dict['username'] = User.get_by_id(aweme_dict['user_id']).username
 
@@ -603,6 +668,8 @@ class Post(BaseModel):
         if self.is_video:
             assert self.video_hash
             yield {
+                'aweme_id': self.id,
+                'sn': 0,
                 'url': self.video_url,
                 'filename': f'{prefix}.mp4',
                 'filepath': filepath,
@@ -619,6 +686,8 @@ class Post(BaseModel):
                 console.log(f'cannot get url of {sn}th img', style='error')
                 continue
             yield {
+                'aweme_id': self.id,
+                'sn': sn,
                 'url': url,
                 'filename': f'{prefix}_{sn}.webp',
                 'filepath': filepath,
@@ -678,6 +747,42 @@ class Post(BaseModel):
         return "\n".join(f'{k}: {v}' for k, v in res.items())
 
 
+class Media(BaseModel):
+    """
+    downloaded files by aweme id and serial number (0 for videos),
+    files moved to other folders afterwards are still known here
+    """
+    aweme_id = BigIntegerField()
+    sn = IntegerField()
+    path = TextField()
+    size = BigIntegerField(null=True)
+    hash = CharField(null=True)
+    downloaded_at = DateTimeTZField()
+
+    class Meta:
+        primary_key = CompositeKey('aweme_id', 'sn')
+
+    @classmethod
+    def downloaded(cls, keys: list[tuple[int, int]]) -> set[tuple[int, int]]:
+        if not keys:
+            return set()
+        query = (cls.select(cls.aweme_id, cls.sn)
+                 .where(Tuple(cls.aweme_id, cls.sn).in_(keys)))
+        return {(m.aweme_id, m.sn) for m in query}
+
+    @classmethod
+    def record(cls, rows: list[dict]):
+        if not rows:
+            return
+        now = pendulum.now()
+        rows = [row | {'downloaded_at': now} for row in rows]
+        (cls.insert_many(rows)
+         .on_conflict(conflict_target=[cls.aweme_id, cls.sn],
+                      preserve=[cls.path, cls.size, cls.hash,
+                                cls.downloaded_at])
+         .execute())
+
+
 class Location(BaseModel):
     id = BigIntegerField(BigIntegerField)
     address = CharField(null=True)
@@ -722,6 +827,3 @@ class Location(BaseModel):
             'latitude': self.latitude,
         }
 
-
-database.create_tables(
-    [User, UserConfig, Artist, Post, Cache, Location])
@@ -0,0 +1,145 @@
+import os
+import random
+import time
+
+from aweme import console
+
+
+class Pacer:
+    """
+    decide how long to wait before each request of one account
+
+    `reserve` books the next request slot and returns seconds to wait for it,
+    `feedback` tells the pacer how the server answered.
+    """
+
+    def __init__(self, name: str = ''):
+        self.name = name
+
+    def reserve(self) -> float:
+        raise NotImplementedError
+
+    def feedback(self, ok: bool, latency: float = 0):
+        pass
+
+
+class FixedSchedule(Pacer):
+    """
+    4 seconds between requests, with longer sleeps at every
+    16/32/64/256/1024/2048 visits, whatever the server answers
+    """
+
+    def __init__(self, name: str = ''):
+        super().__init__(name)
+        self._visit_count = 0
+        self._last_fetch = time.time()
+
+    def reserve(self) -> float:
+        if self._visit_count == 0:
+            self._visit_count = 1
+            self._last_fetch = time.time()
+            return 0
+        for flag in [2048, 1024, 256, 64, 32, 16]:
+            if self._visit_count % flag == 0:
+                sleep_time = flag * 2
+                break
+        else:
+            sleep_time = 4
+
+        sleep_time *= random.uniform(0.75, 1.25)
+        self._last_fetch += sleep_time
+        if (wait_time := (self._last_fetch-time.time())) > 0:
+            console.log(
+                f'{self.name}: sleep {wait_time:.1f} seconds...'
+                f'(count: {self._visit_count})',
+                style='info')
+        elif wait_time < -3600:
+            self._visit_count = 0
+            console.log(
+                f'{self.name}: reset visit count to {self._visit_count} '
+                f'since have no activity for {-wait_time:.1f} seconds, '
+                'which means more than 1 hour passed')
+        else:
+            console.log(
+                f'{self.name}: no sleeping since more than '
+                f'{sleep_time:.1f} seconds passed'
+                f'(count: {self._visit_count})')
+        self._last_fetch = max(self._last_fetch, time.time())
+        self._visit_count += 1
+        return max(wait_time, 0)
+
+
+class AIMDBucket(Pacer):
+    """
+    token bucket whose refill rate follows the server's answers:
+    additive increase after every clean and fast response,
+    multiplicative decrease after an error, an empty body or a response
+    much slower than usual
+    """
+
+    def __init__(self, name: str = '',
+                 rate: float = 1/4,
+                 min_rate: float = 1/60,
+                 max_rate: float = 1,
+                 increase: float = 0.005,
+                 decrease: float = 0.5,
+                 capacity: float = 2,
+                 slow_factor: float = 3):
+        super().__init__(name)
+        self.rate = rate
+        self.min_rate, self.max_rate = min_rate, max_rate
+        self.increase, self.decrease = increase, decrease
+        self.capacity = capacity
+        self.slow_factor = slow_factor
+        self.latency = None
+        self._tokens = 1
+        self._updated = time.time()
+
+    def reserve(self) -> float:
+        now = time.time()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0
+        # the deficit is the queue of requests already booked before us
+        wait_time = -self._tokens / self.rate
+        wait_time *= random.uniform(0.75, 1.25)
+        console.log(
+            f'{self.name}: sleep {wait_time:.1f} seconds...'
+            f'(rate: {self.rate*60:.1f}/min)', style='info')
+        return wait_time
+
+    def feedback(self, ok: bool, latency: float = 0):
+        if ok and self.latency and latency > self.latency * self.slow_factor:
+            console.log(
+                f'{self.name}: response took {latency:.1f}s '
+                f'(usually {self.latency:.1f}s), slowing down',
+                style='warning')
+            ok = False
+        if ok:
+            self.latency = (latency if self.latency is None
+                            else 0.9 * self.latency + 0.1 * latency)
+            self.rate = min(self.max_rate, self.rate + self.increase)
+        else:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            console.log(
+                f'{self.name}: backing off to {self.rate*60:.1f} requests/min',
+                style='warning')
+
+
+POLICIES: dict[str, type[Pacer]] = {
+    'fixed': FixedSchedule,
+    'aimd': AIMDBucket,
+}
+# the fixed schedule keeps its long rests against bans,
+# AWEME_PACING=aimd opts in to the adaptive bucket
+PACING = os.environ.get('AWEME_PACING', 'fixed')
+
+
+def get_pacer(policy: str, name: str = '') -> Pacer:
+    if policy not in POLICIES:
+        raise ValueError(
+            f'unknown pacing policy {policy}, choose from {list(POLICIES)}')
+    return POLICIES[policy](name=name)
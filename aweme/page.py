@@ -4,8 +4,8 @@ from typing import Self
 from furl import furl
 
 from aweme import console
-from aweme.fetcher import fetcher
-from aweme.helper import sort_dict
+from aweme.codec import response_json
+from aweme.fetcher import QUERY_USER_URL, afetcher, fetcher
 
 
 class Page:
@@ -14,8 +14,7 @@ class Page:
 
     @classmethod
     def get_self_page(cls) -> Self:
-        url = 'https://www.douyin.com/aweme/v1/web/query/user/?device_platform=webapp&aid=6383&version_code=170400'
-        user_id = fetcher.get(url).json()['user_uid']
+        user_id = response_json(fetcher.get(QUERY_USER_URL))['user_uid']
         return cls(user_id)
 
     @property
@@ -25,7 +24,7 @@ class Page:
         else:
             return {'user_id': int(self.user_id)}
 
-    def homepage(self):
+    def _homepage_url(self) -> furl:
         f = furl('https://www.douyin.com/aweme/v1/web/aweme/post/')
         f.args = {
             'aid': '6383',
@@ -34,29 +33,44 @@ class Page:
             'publish_video_strategy_type': '2',
         }
         f.args |= self.uid_map
-        aweme_times, aweme_ids = [], []
+        return f
+
+    @staticmethod
+    def _parse_homepage(js: dict, page: int, aweme_times: list) -> list[dict]:
+        assert js.pop('status_code') == 0
+        console.log(
+            f'{len(js["aweme_list"])} awemes found on page {page}',
+            style='notice')
+        awemes = []
+        for aweme in js.pop('aweme_list'):
+            if not aweme['is_top']:
+                aweme_times.append(aweme['create_time'])
+            assert 'aweme_from' not in aweme
+            aweme['aweme_from'] = 'timeline'
+            awemes.append(aweme)
+        return awemes
+
+    def _homepage_steps(self):
+        f = self._homepage_url()
+        aweme_times = []
         for page in itertools.count(1):
-            js = fetcher.get(f).json()
-            assert js.pop('status_code') == 0
-            console.log(
-                f'{len(js["aweme_list"])} awemes found on page {page}',
-                style='notice')
-            for aweme in js.pop('aweme_list'):
-                if not aweme['is_top']:
-                    aweme_times.append(aweme['create_time'])
-                    aweme_ids.append(aweme['aweme_id'])
-                assert 'aweme_from' not in aweme
-                aweme['aweme_from'] = 'timeline'
-                yield sort_dict(aweme)
+            js = yield 'fetch', f
+            for aweme in self._parse_homepage(js, page, aweme_times):
+                yield 'item', aweme
             if js.pop('has_more'):
                 f.args['max_cursor'] = js['max_cursor']
             else:
                 console.log('no more aweme', style='notice')
                 break
         assert sorted(aweme_times, reverse=True) == aweme_times
-        # assert sorted(aweme_ids, reverse=True) == aweme_ids
 
-    def get_following(self, all_info=False):
+    def homepage(self):
+        return _walk(self._homepage_steps())
+
+    def ahomepage(self):
+        return _awalk(self._homepage_steps())
+
+    def _following_url(self) -> furl:
         url = furl('https://www.douyin.com/aweme/v1/web/user/following/list/')
         url.args = {
             'aid': '6383',
@@ -65,23 +79,73 @@ class Page:
             'version_code': '170400',
         }
         url.args |= self.uid_map
+        return url
+
+    @staticmethod
+    def _parse_following(js: dict, all_info: bool) -> list[dict]:
+        followings = []
+        for f in js['followings']:
+            keeped_key = [
+                'nickname',
+                'relation_label',
+                'sec_uid',
+                'short_id',
+                'status',
+                'uid',
+                'unique_id',
+            ]
+            f = {k: v for k, v in f.items() if v not in [None, '', []]}
+            if not all_info:
+                f = {k: v for k, v in f.items() if k in keeped_key}
+            f['homepage'] = f'https://www.douyin.com/user/{f["sec_uid"]}'
+            followings.append(f)
+        return followings
+
+    def _following_steps(self, all_info: bool):
+        url = self._following_url()
         while True:
-            js = fetcher.get(url).json()
-            for f in js['followings']:
-                keeped_key = [
-                    'nickname',
-                    'relation_label',
-                    'sec_uid',
-                    'short_id',
-                    'status',
-                    'uid',
-                    'unique_id',
-                ]
-                f = {k: v for k, v in f.items() if v not in [None, '', []]}
-                if not all_info:
-                    f = {k: v for k, v in f.items() if k in keeped_key}
-                f['homepage'] = f'https://www.douyin.com/user/{f["sec_uid"]}'
-                yield f
+            js = yield 'fetch', url
+            for f in self._parse_following(js, all_info):
+                yield 'item', f
             if not js['has_more']:
                 break
             url.args['max_time'] = js['min_time']
+
+    def get_following(self, all_info=False):
+        return _walk(self._following_steps(all_info))
+
+    def aget_following(self, all_info=False):
+        return _awalk(self._following_steps(all_info))
+
+
+def _walk(steps):
+    """
+    carry out the paging steps of Page, which yield ('fetch', url)
+    to be sent the json of the url, and ('item', value) to pass on
+    """
+    js = None
+    while True:
+        try:
+            kind, value = steps.send(js)
+        except StopIteration:
+            return
+        js = None
+        if kind == 'fetch':
+            js = response_json(fetcher.get(value))
+        else:
+            yield value
+
+
+async def _awalk(steps):
+    """_walk with afetcher"""
+    js = None
+    while True:
+        try:
+            kind, value = steps.send(js)
+        except StopIteration:
+            return
+        js = None
+        if kind == 'fetch':
+            js = response_json(await afetcher.get(value))
+        else:
+            yield value
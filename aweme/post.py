@@ -1,16 +1,20 @@
 import json
 import re
-from copy import deepcopy
 
 import pendulum
 from furl import furl
 
 from aweme import console
-from aweme.fetcher import fetcher
-from aweme.helper import DICT_CMP_AWEME, round_loc, sort_dict
+from aweme.codec import response_json
+from aweme.fetcher import afetcher, fetcher
+from aweme.helper import DICT_CMP_AWEME, round_loc
+from aweme.schema import STRICT, Schema
 
+# bump whenever parse_aweme returns something different for the same input
+PARSER_VERSION = 1
 
-def get_aweme(aweme_id: int) -> dict:
+
+def _aweme_url(aweme_id: int) -> furl:
     url = furl('https://www.douyin.com/aweme/v1/web/aweme/detail/')
     url.args = {'device_platform': 'webapp',
                 'aid': '6383',
@@ -39,31 +43,37 @@ def get_aweme(aweme_id: int) -> dict:
                 'round_trip_time': '50',
                 'webid': '7311600805983176230',
                 }
-    js = fetcher.get(url).json()
+    return url
+
+
+def _parse_detail(js: dict) -> dict:
     assert set(js.keys()) == {'aweme_detail', 'log_pb', 'status_code'}
     assert js.pop('status_code') == 0
     aweme = js.pop('aweme_detail')
     assert 'aweme_from' not in aweme
     aweme['aweme_from'] = 'page'
-    return sort_dict(aweme)
+    return aweme
+
 
+def get_aweme(aweme_id: int, refresh=False) -> dict:
+    r = fetcher.get(_aweme_url(aweme_id), refresh=refresh)
+    return _parse_detail(response_json(r))
 
-def parse_aweme(aweme):
 
-    aweme = deepcopy(aweme)
+async def aget_aweme(aweme_id: int, refresh=False) -> dict:
+    r = await afetcher.get(_aweme_url(aweme_id), refresh=refresh)
+    return _parse_detail(response_json(r))
 
-    # remove useless keys
-    useless_keys = [
+
+AWEME_SCHEMA = Schema(
+    drop=[
         'image_album_music_info', 'video_control',
         'visual_search_info', 'is_use_music', 'impression_data', 'share_info',
         'photo_search_entrance', 'authentication_token', 'interaction_stickers',
         'entertainment_product_info', 'comment_permission_info', 'boost_status',
         'risk_infos', 'xigua_base_info',  'status',
-    ]
-    for key in useless_keys:
-        aweme.pop(key)
-
-    useless_keys_opt = [
+    ],
+    drop_opt=[
         'vtag_search', 'main_arch_common', 'music', 'seo_info',
         'charge_info', 'fall_card_struct', 'incentive_item_type',
         'enable_comment_sticker_rec', 'share_url',
@@ -74,55 +84,83 @@ def parse_aweme(aweme):
         'life_anchor_show_extra', 'chapter_list', 'video_share_edit_status',
         'flash_mob_trends', 'is_24_story', 'friend_interaction',
         'personal_page_botton_diagnose_style',
-    ]
-    for key in useless_keys_opt:
-        aweme.pop(key, None)
-
-    assert aweme.pop('preview_title', '') in aweme['desc']
-    if aweme['mark_largely_following'] is False:
-        assert aweme.pop('mark_largely_following') is False
-    assert aweme.pop('guide_btn_type') == 0
-    assert aweme.pop('prevent_download') is False
-
-    for k, v in DICT_CMP_AWEME.items():
+    ],
+    consts=DICT_CMP_AWEME,
+    expect={'guide_btn_type': 0, 'prevent_download': False},
+    flatten=['statistics'],
+)
+AWEME_TYPES = {
+    0: 'GENERAL',
+    51: 'DUET_VIDEO',
+    53: 'MV',
+    55: 'STICK_POINT_VIDEO',
+    61: 'IMAGE_VIDEO',
+    66: 'RECOMMEND_TMPL_MV',
+    68: 'IMAGE_PUBLISH',
+    109: 'CANVAS',
+    110: 'KARAOKE'
+}
+
+
+def parse_aweme(aweme, strict: bool = None):
+    """
+    parse an aweme of the homepage or detail api without changing it,
+    nested values are read in place and only the top level is copied.
+
+    strict mode checks the payload against what is known of the api,
+    otherwise unexpected values are collected into unknown_fields
+    """
+    strict = STRICT if strict is None else strict
+    aweme, mismatch = AWEME_SCHEMA.apply(aweme, strict)
+    for k, (value, expected) in mismatch.items():
         if k not in aweme:
-            console.log(f'missing key=>{k}:{v}', style='error')
-        elif aweme[k] != v:
-            console.log(
-                f'not matching for key {k}=>{(aweme[k], v)}', style='error')
+            console.log(f'missing key=>{k}:{expected}', style='error')
         else:
-            assert aweme.pop(k) == v
+            console.log(
+                f'not matching for key {k}=>{(value, expected)}', style='error')
+    unknown = {}
+
+    preview_title = aweme.pop('preview_title', '')
+    if strict:
+        assert preview_title in aweme['desc']
+        assert 'mark_largely_following' in aweme
+    if aweme.get('mark_largely_following') is False:
+        aweme.pop('mark_largely_following')
 
     # extra basic info
     author = aweme.pop('author')
     tags, at_users = [], []
     for extra in aweme.pop('text_extra'):
         if set(extra) == {'caption_end', 'caption_start', 'end', 'start', 'type'}:
-            assert extra['type'] not in [0, 1]
+            if strict:
+                assert extra['type'] not in [0, 1]
             continue
         if extra['type'] == 1:
-            assert set(extra.keys()).issubset({
-                'start', 'end', 'type', 'hashtag_name',
-                'hashtag_id', 'is_commerce', 'caption_start', 'caption_end'})
+            if strict:
+                assert set(extra.keys()).issubset({
+                    'start', 'end', 'type', 'hashtag_name',
+                    'hashtag_id', 'is_commerce', 'caption_start',
+                    'caption_end'})
             tags.append(extra['hashtag_name'])
         elif extra['type'] == 0:
-            extra.pop('aweme_id', None)
-            extra.pop('sub_type', None)
-            assert set(extra.keys()) == {
-                'caption_end', 'caption_start', 'end',
-                'sec_uid', 'start', 'type', 'user_id'}
+            if strict:
+                assert set(extra) - {'aweme_id', 'sub_type'} == {
+                    'caption_end', 'caption_start', 'end',
+                    'sec_uid', 'start', 'type', 'user_id'}
             at_users.append(extra['sec_uid'])
-        else:
+        elif strict:
             raise ValueError(extra)
+        else:
+            unknown.setdefault('text_extra', []).append(extra)
     if aweme['images']:
         blog_url = f'https://www.douyin.com/note/{aweme["aweme_id"]}'
     else:
         blog_url = f'https://www.douyin.com/video/{aweme["aweme_id"]}'
     result = {
         'aweme_id': (aweme_id := aweme.pop('aweme_id')),
-        'user_id': int(author.pop('uid')),
-        'sec_uid': author.pop('sec_uid'),
-        'nickname': author.pop('nickname'),
+        'user_id': int(author['uid']),
+        'sec_uid': author['sec_uid'],
+        'nickname': author['nickname'],
         'create_time': pendulum.from_timestamp(
             aweme.pop('create_time'), tz='local'),
         'desc': aweme.pop('desc').strip(),
@@ -136,70 +174,83 @@ def parse_aweme(aweme):
     result['video_tag'] = [tag['tag_name']
                            for tag in aweme.pop('video_tag') if tag['tag_name']]
 
-    statistics = aweme.pop('statistics')
-    assert result | statistics == statistics | result
-    result |= statistics
-
-    media = process_media(aweme.pop('images'), aweme.pop('video'))
-    assert result | media == media | result
+    media = process_media(aweme.pop('images'), aweme.pop('video'), strict)
+    unknown |= media.pop('unknown_fields', {})
+    if strict:
+        assert result | media == media | result
     result |= media
-    assert aweme.pop('media_type') in ([4] if result['is_video'] else [2, 42])
-    try:
-        result['aweme_type'] = {
-            0: 'GENERAL',
-            51: 'DUET_VIDEO',
-            53: 'MV',
-            55: 'STICK_POINT_VIDEO',
-            61: 'IMAGE_VIDEO',
-            66: 'RECOMMEND_TMPL_MV',
-            68: 'IMAGE_PUBLISH',
-            109: 'CANVAS',
-            110: 'KARAOKE'
-        }[result['aweme_type']]
-    except KeyError:
-        raise ValueError(result['aweme_type'],
-                         aweme['search_impr']['entity_type'])
-
-    assert result['user_id'] == aweme.pop('author_user_id')
-    if search_impr := aweme.pop('search_impr', None):
-        assert search_impr.pop('entity_id') == aweme_id
-        assert result['aweme_type'] == search_impr.pop('entity_type')
-        assert not search_impr
+    media_type = aweme.pop('media_type')
+    if strict:
+        assert media_type in ([4] if result['is_video'] else [2, 42])
+    if (aweme_type := result['aweme_type']) in AWEME_TYPES:
+        result['aweme_type'] = AWEME_TYPES[aweme_type]
+    elif strict:
+        raise ValueError(aweme_type, aweme['search_impr']['entity_type'])
+    else:
+        unknown['aweme_type'] = aweme_type
+
+    author_user_id = aweme.pop('author_user_id')
+    search_impr = aweme.pop('search_impr', None)
+    if strict:
+        assert result['user_id'] == author_user_id
+    if search_impr and strict:
+        assert set(search_impr) == {'entity_id', 'entity_type'}
+        assert search_impr['entity_id'] == aweme_id
+        assert result['aweme_type'] == search_impr['entity_type']
+    elif search_impr and (
+            extra := search_impr.keys() - {'entity_id', 'entity_type'}):
+        unknown['search_impr'] = {k: search_impr[k] for k in extra}
 
     if anchor_info := aweme.pop('anchor_info', None):
-        assert 'address' not in result
+        if strict:
+            assert 'address' not in result
         result['address'] = process_anchor(anchor_info)
 
     if dm := aweme.pop('danmaku_control', None):
-        assert result['is_video'] is True
-        assert 'danmaku_cnt' not in result
+        if strict:
+            assert result['is_video'] is True
+            assert 'danmaku_cnt' not in result
         result['danmaku_cnt'] = dm['danmaku_cnt']
 
-    assert aweme.pop('duration') == result.get('duration', 0)
+    duration = aweme.pop('duration')
+    if strict:
+        assert duration == result.get('duration', 0)
 
-    assert aweme | result == result | aweme
+    clash = {k for k in aweme.keys() & result.keys() if aweme[k] != result[k]}
+    if strict:
+        assert not clash, clash
+    unknown |= {k: aweme.pop(k) for k in clash}
     result |= aweme
     result = {k: v for k, v in result.items()
               if v not in [None, [], {}, '']}
 
-    assert 'id' not in result
+    if strict:
+        assert 'id' not in result
     result['id'] = int(result.pop('aweme_id'))
     result['group_id'] = int(result['group_id'])
     if result['is_video']:
-        if (ht := result.pop('horizontal_type', None)) == 1:
+        ht = result.pop('horizontal_type', None)
+        if strict and ht == 1:
             assert result['width'] > result['height']
-        else:
+        elif strict:
             assert ht is None
             # assert result['width'] <= result['height']
     if 'caption' in result:
-        assert re.sub(r'\s', '', result.pop('caption')
-                      ) in re.sub(r'\s', '', result['desc'])
+        caption = result.pop('caption')
+        if strict:
+            assert re.sub(r'\s', '', caption) in re.sub(
+                r'\s', '', result['desc'])
 
     # process mix info
     if mix_info := result.get('mix_info'):
-        for key in ['cover_url', 'share_info', 'extra']:
-            mix_info.pop(key)
-
+        useless = {'cover_url', 'share_info', 'extra'}
+        if strict:
+            assert useless <= set(mix_info)
+        result['mix_info'] = {k: v for k, v in mix_info.items()
+                              if k not in useless}
+
+    if unknown:
+        result['unknown_fields'] = unknown
     return result
 
 
@@ -224,93 +275,108 @@ def process_anchor(anchor_info):
     return address
 
 
-def process_media(img_list, vid_dict):
-    vid_dict = deepcopy(vid_dict)
-    vid_dict.pop('audio', None)
-    img_list = deepcopy(img_list)
-    if img_list is None:
-        return process_media_for_vid(vid_dict)
-    img_ids = [img['uri'] for img in img_list]
-    img_urls = [(img['url_list'] or [''])[0] for img in img_list]
-    vid_dict.pop('big_thumbs')
-    assert vid_dict.pop('bit_rate_audio') is None
-    vid_dict.pop('cover')
-    assert vid_dict.pop('origin_cover')['uri']
-    assert vid_dict.pop('play_addr')
-    assert vid_dict.pop('duration') == 0
-    if 'has_watermark' in vid_dict:
-        assert vid_dict.pop('has_watermark') is False
-        assert vid_dict.pop('is_h265') == 0
-    vid_dict.pop('meta')
-    assert vid_dict.pop('ratio') == 'default'
-    vid_dict = {k: v for k, v in vid_dict.items() if v not in [None, [], {}]}
-    assert set(vid_dict.keys()) == {'height', 'width'},  set(vid_dict.keys())
-    return dict(img_ids=img_ids, img_urls=img_urls, is_video=False)
-
-
-def process_media_for_vid(vid_dict):
-    vid_dict = deepcopy(vid_dict)
-    # pop useless keys
-    for k in ['cover', 'origin_cover', 'gaussian_cover',
+# the video dict of an image post
+IMAGE_VIDEO_SCHEMA = Schema(
+    drop=['big_thumbs', 'cover', 'meta', 'origin_cover', 'play_addr'],
+    drop_opt=['audio'],
+    consts={'has_watermark': False, 'is_h265': 0},
+    expect={'bit_rate_audio': None, 'duration': 0, 'ratio': 'default'},
+)
+VIDEO_SCHEMA = Schema(
+    drop_opt=['cover', 'origin_cover', 'gaussian_cover',
               'dynamic_cover', 'meta', 'height', 'width',
               'big_thumbs', 'misc_download_addrs', 'cover_original_scale',
               'animated_cover', 'use_static_cover', 'optimized_cover',
-              'horizontal_type', 'is_h265', 'cdn_url_expired', 'bit_rate_audio',
-              'audio', 'raw_cover',
-              ]:
-        vid_dict.pop(k, None)
+              'horizontal_type', 'is_h265', 'cdn_url_expired',
+              'bit_rate_audio', 'audio', 'raw_cover'],
+)
+# the video dict once merged with its best bit rate and play_addr
+PLAY_SCHEMA = Schema(
+    drop=['quality_type', 'is_h265', 'is_bytevc1', 'FPS',
+          'is_source_HDR', 'gear_name', 'ratio'],
+    drop_opt=['video_extra', 'file_cs', 'url_key', 'is_long_video'],
+    expect={'HDR_bit': '', 'HDR_type': '', 'video_model': ''},
+)
+
+
+def process_media(img_list, vid_dict, strict=True):
+    if img_list is None:
+        return process_media_for_vid(vid_dict, strict)
+    img_ids = [img['uri'] for img in img_list]
+    img_urls = [(img['url_list'] or [''])[0] for img in img_list]
+    if strict:
+        assert vid_dict['origin_cover']['uri']
+        assert vid_dict['play_addr']
+        assert {'height', 'width'} <= vid_dict.keys()
+    vid_dict, _ = IMAGE_VIDEO_SCHEMA.apply(vid_dict, strict)
+    vid_dict = {k: v for k, v in vid_dict.items()
+                if v not in [None, [], {}] and k not in ['height', 'width']}
+    result = dict(img_ids=img_ids, img_urls=img_urls, is_video=False)
+    if strict:
+        assert not vid_dict, set(vid_dict.keys())
+    elif vid_dict:
+        result['unknown_fields'] = {'video': vid_dict}
+    return result
 
-    assert 'uri' not in vid_dict
+
+def process_media_for_vid(vid_dict, strict=True):
+    vid_dict, _ = VIDEO_SCHEMA.apply(vid_dict, strict)
+
+    if strict:
+        assert 'uri' not in vid_dict
     vid_dict['uri'] = uri = vid_dict['play_addr']['uri']
-    if 'download_addr' in vid_dict:
-        assert vid_dict.pop('download_addr')['uri'] == uri
-        if 'download_suffix_logo_addr' in vid_dict:
-            assert vid_dict.pop('download_suffix_logo_addr')['uri'] == uri
-            assert vid_dict.pop('has_download_suffix_logo_addr') is True
-        assert vid_dict.pop('has_watermark') is True
+    if download_addr := vid_dict.pop('download_addr', None):
+        logo_addr = vid_dict.pop('download_suffix_logo_addr', None)
+        has_logo = vid_dict.pop('has_download_suffix_logo_addr', None)
+        has_watermark = vid_dict.pop('has_watermark', None)
+        if strict:
+            assert download_addr['uri'] == uri
+            if logo_addr is None:
+                assert has_logo is None
+            else:
+                assert logo_addr['uri'] == uri
+                assert has_logo is True
+            assert has_watermark is True
 
     # process bit_rate
     bit_rate = vid_dict.pop('bit_rate')
     play_addrs = [b['play_addr'] for b in bit_rate]
     for key in ['play_addr', 'play_addr_265', 'play_addr_h264']:
-        if play_addr := vid_dict.pop(key, None):
-            if play_addr not in play_addrs:
-                assert play_addr['uri'] == uri
-                assert (play_addr['width']
-                        <= bit_rate[0]['play_addr']['width'])
-                assert (play_addr['height']
-                        <= bit_rate[0]['play_addr']['height'])
+        play_addr = vid_dict.pop(key, None)
+        if strict and play_addr and play_addr not in play_addrs:
+            assert play_addr['uri'] == uri
+            assert (play_addr['width']
+                    <= bit_rate[0]['play_addr']['width'])
+            assert (play_addr['height']
+                    <= bit_rate[0]['play_addr']['height'])
     for b in bit_rate[1:]:
         if b['bit_rate'] > bit_rate[0]['bit_rate']:
             console.log(
                 f'bit_rate is not maximum {b["bit_rate"], bit_rate[0]["bit_rate"]}', style='error')
-        assert b['play_addr']['uri'] == uri
-    assert vid_dict | bit_rate[0] == bit_rate[0] | vid_dict
+        if strict:
+            assert b['play_addr']['uri'] == uri
+    if strict:
+        assert vid_dict | bit_rate[0] == bit_rate[0] | vid_dict
     vid_dict |= bit_rate[0]
-    assert vid_dict.pop('format', 'mp4') == 'mp4'
+    video_format = vid_dict.pop('format', 'mp4')
+    if strict:
+        assert video_format == 'mp4'
 
     # process play_addr
     play_addr = vid_dict.pop('play_addr')
-    assert vid_dict | play_addr == play_addr | vid_dict
+    if strict:
+        assert vid_dict | play_addr == play_addr | vid_dict
     vid_dict |= play_addr
 
     # get url
     url = vid_dict.pop('url_list')[-1]
-    assert f'video_id={uri}' in url
-    assert url.startswith('https://www.douyin.com/aweme/v1/play/?')
-    assert 'url' not in vid_dict
+    if strict:
+        assert f'video_id={uri}' in url
+        assert url.startswith('https://www.douyin.com/aweme/v1/play/?')
+        assert 'url' not in vid_dict
     vid_dict['url'] = url
 
-    # pop useless keys
-    for k in ['video_extra', 'file_cs', 'url_key', 'is_long_video']:
-        vid_dict.pop(k, None)
-    assert vid_dict.pop('HDR_bit') == ''
-    assert vid_dict.pop('HDR_type') == ''
-    assert vid_dict.pop('video_model') == ''
-    vid_dict.pop('quality_type')
-    for key in ['is_h265', 'is_bytevc1', 'FPS', 'is_source_HDR', 'gear_name', 'ratio']:
-        vid_dict.pop(key)
-
+    vid_dict, _ = PLAY_SCHEMA.apply(vid_dict, strict)
     result = {
         'video_id': vid_dict.pop('uri'),
         'video_url': vid_dict.pop('url'),
@@ -322,5 +388,8 @@ def process_media_for_vid(vid_dict):
         'width': vid_dict.pop('width'),
         'is_video': True,
     }
-    assert not vid_dict, vid_dict
+    if strict:
+        assert not vid_dict, vid_dict
+    elif vid_dict:
+        result['unknown_fields'] = {'video': vid_dict}
     return result
@@ -0,0 +1,190 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from aweme import console
+from aweme.metrics import metrics
+
+# errors meaning we are offline, they are retried without limit
+OFFLINE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# endpoint name of media downloads, everything else is the api
+DOWNLOAD = 'download'
+# a media url answering these is expired or gone, retrying cannot help
+FATAL_MEDIA_STATUS = {403, 404, 410}
+
+
+class RetryPolicy:
+    """
+    exponential backoff with jitter, soft blocks (empty bodies, verify pages)
+    start from a much longer base than transient failures
+    """
+
+    def __init__(self, base: float = 2, soft_base: float = 60,
+                 cap: float = 1800, max_tries: int = 10):
+        self.base, self.soft_base = base, soft_base
+        self.cap = cap
+        self.max_tries = max_tries
+
+    def delay(self, attempt: int, soft: bool = False,
+              retry_after: float | None = None) -> float:
+        base = self.soft_base if soft else self.base
+        delay = min(self.cap, base * 2 ** (attempt - 1))
+        # equal jitter: keep half of the delay, randomize the other half
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.cap))
+        return delay
+
+
+def retry_after(r: httpx.Response | None) -> float | None:
+    """seconds asked by the Retry-After header, given in seconds or date"""
+    if r is None or not (value := r.headers.get('Retry-After')):
+        return
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return
+
+
+def classify(error: Exception | None, r: httpx.Response | None,
+             nbytes: int | None = None,
+             endpoint: str | None = None) -> str | None:
+    """
+    None for a good response, otherwise one of 'offline', 'soft'
+    (empty body or verify page of the api), 'fatal' (a media url which
+    expired or is gone) and 'transient'.
+    nbytes is the body size of a streamed response, whose content is
+    not kept in memory
+    """
+    if isinstance(error, OFFLINE_ERRORS):
+        return 'offline'
+    status = None if r is None else r.status_code
+    if endpoint == DOWNLOAD:
+        if status in FATAL_MEDIA_STATUS:
+            return 'fatal'
+        if error is not None or not (nbytes if nbytes is not None
+                                     else len(r.content)):
+            return 'transient'
+        return
+    if error is not None:
+        return 'soft' if status == 403 else 'transient'
+    if nbytes is None:
+        nbytes = len(r.content)
+    if not nbytes or 'bdturing-verify' in r.headers:
+        return 'soft'
+    if (r.url.path.startswith('/aweme/')
+            and 'json' not in r.headers.get('content-type', 'json')):
+        return 'soft'
+
+
+class CircuitBreaker:
+    """
+    open after `threshold` consecutive failures against one host, so that
+    every worker waits out the outage together instead of each retrying
+    on its own. The cooldown doubles each time the breaker reopens.
+    """
+
+    def __init__(self, host: str, threshold: int = 5,
+                 cooldown: float = 30, max_cooldown: float = 1800):
+        self.host = host
+        self.threshold = threshold
+        self.min_cooldown, self.max_cooldown = cooldown, max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        return max(0.0, self.open_until - time.time())
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.cooldown = self.min_cooldown
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.threshold or self.wait_time():
+                return
+            self.open_until = time.time() + self.cooldown
+            console.log(
+                f'{self.host}: {self.failures} failures in a row, '
+                f'pausing all requests for {self.cooldown:.0f} seconds',
+                style='error')
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            # half open: one more failure after the pause reopens it
+            self.failures = self.threshold - 1
+
+
+policy = RetryPolicy()
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def _breaker_of(url: httpx.URL, endpoint: str | None) -> CircuitBreaker:
+    """
+    downloads have breakers of their own, video urls are on the api host
+    and their failures should not pause the api
+    """
+    if endpoint == DOWNLOAD:
+        return get_breaker(f'{url.host} (download)')
+    return get_breaker(url.host)
+
+
+def check(url: str | httpx.URL, endpoint: str, attempt: int, latency: float,
+          error: httpx.HTTPError = None,
+          r: httpx.Response = None, nbytes: int = None) -> float | None:
+    """
+    record the outcome of one attempt in metrics and the host's breaker,
+    return None if the response is good, otherwise seconds to sleep
+    before the next attempt. Raise once `policy.max_tries` is exceeded.
+    Pass nbytes for streamed responses.
+    """
+    url = httpx.URL(str(url))
+    breaker = _breaker_of(url, endpoint)
+    if error is not None:
+        r = getattr(error, 'response', None)
+    if (kind := classify(error, r, nbytes, endpoint)) is None:
+        metrics.observe(endpoint, latency,
+                        len(r.content) if nbytes is None else nbytes)
+        breaker.success()
+        return
+    metrics.error(endpoint, error or f'{kind}_block', latency)
+    if kind == 'fatal':
+        # the url is at fault, not the host
+        raise error or ValueError(f'{r.status_code} for {url}')
+    breaker.failure()
+    if kind != 'offline' and attempt >= policy.max_tries:
+        if error is not None:
+            raise error
+        raise ValueError(f'{kind} blocked after {attempt} tries: {url}')
+    delay = policy.delay(attempt, soft=kind == 'soft',
+                         retry_after=retry_after(r))
+    console.log(
+        f"{error or kind + ' block'}: sleep {delay:.0f} seconds and "
+        f"retry [link={url}]{url}[/link] ({attempt}th failure)",
+        style='error')
+    metrics.retry(endpoint)
+    metrics.slept('retry', delay)
+    return delay
+
+
+def wait_breaker(url: str | httpx.URL, endpoint: str | None = None) -> float:
+    """seconds to wait until the breaker of url's host closes again"""
+    breaker = _breaker_of(httpx.URL(str(url)), endpoint)
+    if (wait := breaker.wait_time()) > 0:
+        metrics.slept('breaker', wait)
+    return wait
@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+
+from aweme import console
+from aweme.metrics import metrics
+
+
+class Bandwidth:
+    """
+    token bucket over the bytes read by all downloads,
+    rate in bytes per second, None for no cap
+    """
+
+    def __init__(self, rate: float | None = None, burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes: int):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate * self.burst,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            metrics.slept('bandwidth', wait)
+            time.sleep(wait)
+
+
+class Lane:
+    """
+    a queue of one kind of media with its own workers. How many of them
+    download at once is tuned every `window` files: keep going the way
+    throughput improved, turn around when it dropped and halve on retries.
+    """
+
+    def __init__(self, name: str, workers: int, window: int = 8):
+        self.name = name
+        self.workers = workers
+        self.limit = max(1, workers // 2)
+        self.window = window
+        self.queue = queue.Queue(workers * 10)
+        self.active = 0
+        self._cond = threading.Condition()
+        self._step = 1
+        self._last_rate = 0.0
+        self._reset_window()
+
+    def _reset_window(self):
+        self._done, self._bytes = 0, 0
+        self._window_start = time.perf_counter()
+        self._retries = metrics.snapshot()['retries'].get('download', 0)
+
+    def acquire(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.active -= 1
+            self._done += 1
+            self._bytes += nbytes
+            if self._done >= self.window:
+                self._tune()
+            self._cond.notify_all()
+
+    def _tune(self):
+        rate = self._bytes / (time.perf_counter() - self._window_start)
+        retries = metrics.snapshot()['retries'].get('download', 0)
+        if retries > self._retries:
+            self.limit, self._step = max(1, self.limit // 2), 1
+        else:
+            if rate < self._last_rate:
+                self._step = -self._step
+            self.limit = min(self.workers, max(1, self.limit + self._step))
+        console.log(f'{self.name} lane: {rate / 2**20:.2f} MiB/s, '
+                    f'{retries - self._retries} retries, '
+                    f'{self.limit} downloads at once', style='dim')
+        self._last_rate = rate
+        self._reset_window()
+
+
+bandwidth = Bandwidth()
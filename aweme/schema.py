@@ -0,0 +1,77 @@
+import os
+
+# AWEME_PARSE_MODE=fast skips validating payloads, so that an unexpected
+# field ends up in unknown_fields instead of stopping the run
+STRICT = os.environ.get('AWEME_PARSE_MODE', 'strict') != 'fast'
+
+DROP, CONST, EXPECT, RENAME, FLATTEN = range(5)
+
+
+class Schema:
+    """
+    field rules of one api object, compiled once into a table of
+    key -> rule so that a payload is sorted out in a single pass:
+
+    drop: thrown away, strict mode requires them
+    drop_opt: thrown away if present
+    consts: dropped when they have the expected value, otherwise kept
+        and reported as mismatch
+    expect: like consts, but strict mode requires them and fails on
+        another value
+    rename: key -> new name
+    flatten: keys whose dict is merged into the fields
+
+    keys without a rule are kept as they are
+    """
+
+    def __init__(self, drop=(), drop_opt=(), consts: dict = None,
+                 expect: dict = None, rename: dict = None, flatten=()):
+        self.consts = consts or {}
+        self.required = frozenset(drop) | frozenset(expect or ())
+        self.rules: dict[str, tuple] = {}
+        for key in [*drop, *drop_opt]:
+            self.rules[key] = (DROP, None)
+        for key, value in self.consts.items():
+            self.rules[key] = (CONST, value)
+        for key, value in (expect or {}).items():
+            self.rules[key] = (EXPECT, value)
+        for key, name in (rename or {}).items():
+            self.rules[key] = (RENAME, name)
+        for key in flatten:
+            self.rules[key] = (FLATTEN, None)
+
+    def apply(self, obj: dict, strict: bool = None
+              ) -> tuple[dict, dict[str, tuple]]:
+        """
+        return the kept fields and the consts which do not match,
+        as key: (value, expected), value is None for a missing const
+        """
+        strict = STRICT if strict is None else strict
+        if strict and (missing := self.required - obj.keys()):
+            raise KeyError(f'missing keys: {sorted(missing)}')
+        fields, mismatch = {}, {}
+        for key, value in obj.items():
+            if (rule := self.rules.get(key)) is None:
+                fields[key] = value
+                continue
+            kind, arg = rule
+            if kind == DROP:
+                continue
+            if kind == RENAME:
+                fields[arg] = value
+                continue
+            if kind == FLATTEN:
+                if strict:
+                    assert fields | value == value | fields, key
+                fields |= value
+                continue
+            if value == arg:
+                continue
+            if strict and kind == EXPECT:
+                raise ValueError(f'{key}: expected {arg!r}, got {value!r}')
+            mismatch[key] = (value, arg)
+            fields[key] = value
+        if strict:
+            for key in self.consts.keys() - obj.keys():
+                mismatch[key] = (None, self.consts[key])
+        return fields, mismatch
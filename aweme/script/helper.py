@@ -8,6 +8,8 @@ from rich.terminal_theme import MONOKAI
 
 from aweme import console
 from aweme.fetcher import fetcher
+from aweme.metrics import metrics
+from aweme.transport import transport_stats
 
 if not (d := Path('/Volumes/Art')).exists():
     d = Path.home()/'Pictures'
@@ -46,6 +48,9 @@ def save_log(func_name, download_dir: Path):
     log_file = f"{func_name}_{time_format}.html"
     console.log(f'Saving log to {download_dir / log_file}')
     console.save_html(download_dir / log_file, theme=MONOKAI)
+    metrics_file = f"{func_name}_{time_format}_metrics"
+    (download_dir / f'{metrics_file}.json').write_text(metrics.to_json())
+    (download_dir / f'{metrics_file}.prom').write_text(metrics.to_prometheus())
 
 
 class LogSaver:
@@ -66,6 +71,8 @@ class LogSaver:
             f'threshold: {self.SAVE_LOG_FOR_COUNT}')
         console.log(
             f'log hours: {log_hours}, threshold: {self.SAVE_LOG_INTERVAL}h')
+        for kind, stats in transport_stats().items():
+            console.log(f'{kind} connections: {stats}')
         if (log_hours > self.SAVE_LOG_INTERVAL or
                 fetch_count > self.SAVE_LOG_FOR_COUNT):
             console.log('Threshold reached, saving log automatically...')
@@ -6,14 +6,11 @@ from itertools import islice
 from pathlib import Path
 
 import pendulum
-from peewee import fn
 from rich.prompt import Confirm, Prompt
 from typer import Option, Typer
 
 from aweme import console
 from aweme.fetcher import fetcher
-from aweme.model import Cache, User, UserConfig
-from aweme.page import Page
 
 from .helper import LogSaver, default_path, logsaver_decorator, print_command
 
@@ -24,6 +21,8 @@ app = Typer()
 @logsaver_decorator
 def user_add(max_user: int = 20,
              all_user: bool = Option(False, '--all-user', '-a')):
+    from aweme.model import UserConfig
+    from aweme.page import Page
     fetcher.toggle_alt(False)
     if all_user:
         max_user = None
@@ -52,10 +51,20 @@ def user_add(max_user: int = 20,
 @logsaver_decorator
 def user_loop(frequency: float = 2,
               download_dir: Path = default_path,
+              bandwidth: float = Option(
+                  0, help='cap of all downloads in MiB/s, 0 for no cap'),
               ):
+    from peewee import fn
+
+    from aweme.download import resume_partials
+    from aweme.model import Media, Post, UserConfig
+    from aweme.scheduler import bandwidth as limiter
+
+    limiter.rate = bandwidth * 2**20 or None
 
     fetcher.login(alt_login=True)
     fetcher.login(alt_login=False)
+    resume_partials(download_dir, Post, manifest=Media)
     UserConfig.update_table()
     WORKING_TIME = 20
     logsaver = LogSaver('user_loop', download_dir)
@@ -149,6 +158,7 @@ def write_meta(download_dir: Path = default_path):
 @logsaver_decorator
 def user(download_dir: Path = default_path):
     """Add user to database of users whom we want to fetch from"""
+    from aweme.model import User, UserConfig
     fetcher.toggle_alt(False)
     UserConfig.update_table()
     user = UserConfig.select().order_by(UserConfig.id.desc()).first()
@@ -164,7 +174,7 @@ def user(download_dir: Path = default_path):
         if isinstance(user_id, int):
             if uc := UserConfig.get_or_none(user_id=user_id):
                 console.log(f'用户{uc.username}已在列表中')
-        uc = UserConfig.from_id(user_id)
+        uc = UserConfig.from_id(user_id, refresh=True)
         console.log(uc)
         uc.aweme_fetch = Confirm.ask(f"是否获取{uc.username}的主页？", default=True)
         uc.save()
@@ -183,6 +193,7 @@ def user(download_dir: Path = default_path):
 
 @app.command()
 def clean_database():
+    from aweme.model import Cache, User
     for u in User:
         if (u.artist and u.artist[0].photos_num) or u.config:
             continue
@@ -0,0 +1,93 @@
+import itertools
+import json
+import time
+from pathlib import Path
+
+import httpx
+
+from aweme.pacer import PACING, Pacer, get_pacer
+from aweme.transport import get_transport
+
+UA = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+HEADERS = {
+    "authority": "www.douyin.com",
+    "sec-ch-ua": '"Not_A Brand";v="8", "Chromium";v="120"',
+    "accept": "application/json, text/plain, */*",
+    "dnt": "1",
+    "sec-ch-ua-mobile": "?0",
+    "user-agent": UA,
+    "sec-ch-ua-platform": '"macOS"',
+    "sec-fetch-site": "same-origin",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-dest": "empty",
+    "referer": "https://www.douyin.com/user",
+    "accept-encoding": "gzip, deflate, br",
+    "accept-language": "en-US,en;q=0.9,zh-CN;q=0.8,zh;q=0.7",
+}
+COOKIE_FILE = Path(__file__).with_name('cookie.json')
+
+
+class Account:
+    """one logged in douyin account with its own client and pacing"""
+
+    def __init__(self, name: str, cookies: dict | None, pacer: Pacer):
+        self.name = name
+        self.client = httpx.Client(headers=HEADERS, cookies=cookies,
+                                   transport=get_transport('api'))
+        self.pacer = pacer
+        self.last_used = 0.0
+        self.nickname = None
+        self.verified_at = 0.0
+
+    @property
+    def is_alt(self) -> bool:
+        return self.name != 'main'
+
+    def __repr__(self):
+        return f'Account({self.name}, {self.nickname})'
+
+
+class SessionPool:
+    """
+    the `main` account of cookie.json plus any number of alt accounts,
+    stored under any other key. Fetches which need no following relation
+    are spread over the alt accounts.
+    """
+
+    def __init__(self, pacing: str = PACING, strategy: str = 'lru'):
+        if strategy not in ('lru', 'round_robin'):
+            raise ValueError(f'unknown strategy {strategy}')
+        self.strategy = strategy
+        if COOKIE_FILE.exists():
+            cookies = json.loads(COOKIE_FILE.read_text())
+        else:
+            cookies = {}
+        cookies.setdefault('main', None)
+        if len(cookies) == 1:
+            cookies['alt'] = None
+        self.accounts = {name: Account(name, c, get_pacer(pacing, name=name))
+                         for name, c in cookies.items()}
+        self._cycle = itertools.cycle(self.alts)
+
+    @property
+    def main(self) -> Account:
+        return self.accounts['main']
+
+    @property
+    def alts(self) -> list[Account]:
+        return [a for a in self.accounts.values() if a.is_alt]
+
+    def pick(self, alt_login: bool) -> Account:
+        if not alt_login:
+            account = self.main
+        elif self.strategy == 'round_robin':
+            account = next(self._cycle)
+        else:
+            account = min(self.alts, key=lambda a: a.last_used)
+        account.last_used = time.time()
+        return account
+
+    def save_cookies(self):
+        cookies = {name: {c.name: c.value for c in a.client.cookies.jar}
+                   for name, a in self.accounts.items()}
+        COOKIE_FILE.write_text(json.dumps(cookies))
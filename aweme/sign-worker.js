@@ -0,0 +1,20 @@
+// long-lived X-Bogus signer: reads `[query, userAgent]` JSON lines from
+// stdin and answers each of them with one JSON line on stdout
+const fs = require("fs");
+const path = require("path");
+const readline = require("readline");
+
+const source = fs.readFileSync(path.join(__dirname, "X-Bogus.js"), "utf8");
+const sign = new Function("require", source + "\nreturn sign;")(require);
+
+const rl = readline.createInterface({ input: process.stdin, terminal: false });
+rl.on("line", function (line) {
+    var res;
+    try {
+        var [query, ua] = JSON.parse(line);
+        res = { result: sign(query, ua) };
+    } catch (e) {
+        res = { error: String(e) };
+    }
+    process.stdout.write(JSON.stringify(res) + "\n");
+});
@@ -0,0 +1,58 @@
+import atexit
+import json
+import subprocess
+import threading
+from pathlib import Path
+
+WORKER_JS = Path(__file__).with_name('sign-worker.js')
+
+
+class XBogusSigner:
+    """
+    sign query strings with X-Bogus.js inside one long-lived node process,
+    instead of spawning a new node for every call as execjs does
+    """
+
+    def __init__(self, node: str = 'node'):
+        self.node = node
+        self._proc: subprocess.Popen | None = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            [self.node, str(WORKER_JS)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding='utf-8', bufsize=1)
+
+    def _call(self, query: str, ua: str) -> dict:
+        if self._proc is None or self._proc.poll() is not None:
+            self._start()
+        self._proc.stdin.write(json.dumps([query, ua]) + '\n')
+        self._proc.stdin.flush()
+        if not (line := self._proc.stdout.readline()):
+            self.close()
+            raise ValueError('sign worker exited unexpectedly')
+        return json.loads(line)
+
+    def sign(self, query: str, ua: str) -> str:
+        with self._lock:
+            try:
+                res = self._call(query, ua)
+            except (BrokenPipeError, ValueError):
+                # the worker died between two calls, restart it once
+                res = self._call(query, ua)
+        if 'error' in res:
+            raise ValueError(f'failed to sign {query}: {res["error"]}')
+        return res['result']
+
+    def close(self):
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        if proc.poll() is None:
+            proc.stdin.close()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
@@ -0,0 +1,107 @@
+import importlib.util
+from collections import Counter
+
+import httpx
+
+from aweme import console
+from aweme.cassette import (
+    AsyncCassetteTransport,
+    CassetteTransport,
+    get_cassette
+)
+
+# api: www.douyin.com only, so the pool limits are the per host limits.
+# cdn: media downloads, shared by all download threads.
+TRANSPORT_CONFIG = {
+    'api': dict(http2=True, max_connections=8,
+                max_keepalive_connections=4, keepalive_expiry=120),
+    'cdn': dict(http2=False, max_connections=32,
+                max_keepalive_connections=16, keepalive_expiry=30),
+}
+
+
+class TransportStats:
+    """count requests against new TCP/TLS handshakes of one pool"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.counter = Counter()
+
+    def trace(self, event_name: str, info: dict):
+        if event_name == 'connection.connect_tcp.complete':
+            self.counter['connections'] += 1
+        elif event_name == 'connection.start_tls.complete':
+            self.counter['tls_handshakes'] += 1
+        elif event_name == 'http2.send_request_headers.started':
+            self.counter['http2_requests'] += 1
+
+    async def atrace(self, event_name: str, info: dict):
+        self.trace(event_name, info)
+
+    def snapshot(self) -> dict:
+        requests = self.counter['requests']
+        connections = self.counter['connections']
+        return {
+            'requests': requests,
+            'connections': connections,
+            'tls_handshakes': self.counter['tls_handshakes'],
+            'http2_requests': self.counter['http2_requests'],
+            'reused': requests - connections,
+            'reuse_ratio': (1 - connections / requests) if requests else 0,
+        }
+
+
+class StatsTransport(httpx.HTTPTransport):
+    def __init__(self, stats: TransportStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.counter['requests'] += 1
+        request.extensions['trace'] = self.stats.trace
+        return super().handle_request(request)
+
+
+class AsyncStatsTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: TransportStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(
+            self, request: httpx.Request) -> httpx.Response:
+        self.stats.counter['requests'] += 1
+        request.extensions['trace'] = self.stats.atrace
+        return await super().handle_async_request(request)
+
+
+_stats: dict[str, TransportStats] = {}
+_transports: dict[tuple[str, bool], httpx.BaseTransport] = {}
+
+
+def get_transport(kind: str, asynchronous: bool = False):
+    """the shared transport of `kind` (api or cdn), built on first use"""
+    if (kind, asynchronous) in _transports:
+        return _transports[kind, asynchronous]
+    config = TRANSPORT_CONFIG[kind].copy()
+    http2 = config.pop('http2')
+    if http2 and importlib.util.find_spec('h2') is None:
+        console.log(f'{kind} transport: h2 is not installed, '
+                    'falling back to HTTP/1.1', style='warning')
+        http2 = False
+    stats = _stats.setdefault(kind, TransportStats(kind))
+    cls = AsyncStatsTransport if asynchronous else StatsTransport
+    transport = cls(stats, http2=http2, limits=httpx.Limits(**config))
+    if cassette := get_cassette():
+        cls = AsyncCassetteTransport if asynchronous else CassetteTransport
+        transport = cls(cassette, transport)
+    _transports[kind, asynchronous] = transport
+    return transport
+
+
+def discard_transport(kind: str, asynchronous: bool = False):
+    """forget a closed transport, the next get_transport builds a new one"""
+    _transports.pop((kind, asynchronous), None)
+
+
+def transport_stats() -> dict[str, dict]:
+    return {kind: stats.snapshot() for kind, stats in _stats.items()}
@@ -1,11 +1,13 @@
 import httpx
 
 from aweme import console
-from aweme.fetcher import fetcher
+from aweme.codec import response_json
+from aweme.fetcher import afetcher, fetcher
 from aweme.helper import DICT_CMP_USER
+from aweme.schema import STRICT, Schema
 
 
-def get_user(user_id: int | str, parse=True):
+def _user_params(user_id: int | str) -> dict:
     params = {
         'aid': '6383',
         'version_code': '170400',
@@ -16,148 +18,186 @@ def get_user(user_id: int | str, parse=True):
     else:
         sec_user_id = user_id.split('?')[0].split('/')[-1]
         params['sec_user_id'] = sec_user_id
+    return params
 
-    url = "https://www.douyin.com/aweme/v1/web/user/profile/other/"
-    response = fetcher.get(url, params=params, alt_login=False)
+
+PROFILE_URL = "https://www.douyin.com/aweme/v1/web/user/profile/other/"
+
+
+def get_user(user_id: int | str, parse=True, refresh=False):
+    response = fetcher.get(
+        PROFILE_URL, params=_user_params(user_id), alt_login=False,
+        refresh=refresh)
     return parse_user(response) if parse else response
 
 
-def parse_user(r: httpx.Response):
-    # process js
-    js = r.json()
-    assert js.pop('status_code') == 0
-    assert js.pop('status_msg') is None
-    extra = js.pop('extra')
+async def aget_user(user_id: int | str, parse=True, refresh=False):
+    response = await afetcher.get(
+        PROFILE_URL, params=_user_params(user_id), alt_login=False,
+        refresh=refresh)
+    return parse_user(response) if parse else response
 
-    assert js.pop('log_pb') == {'impr_id': extra.pop('logid')}
-    assert extra.pop('fatal_item_ids') == []
-    assert list(extra.keys()) == ['now']
-    assert list(js.keys()) == ['user']
 
-    # process user
-    user = js.pop('user')
-    # process avatar
-    avatar = user.pop('avatar_larger')['url_list']
-    assert len(avatar) == 1
-    assert 'avatar' not in user
-    user['avatar'] = avatar[0].split('?')[0]
-    # remove useless keys
-    useless_keys = [
+USER_SCHEMA = Schema(
+    drop=[
         'share_info', 'white_cover_url',
         'cover_and_head_image_info', 'cover_url', 'cover_colour',
         'avatar_168x168', 'avatar_300x300', 'avatar_medium', 'avatar_thumb',
         'signature_display_lines', 'urge_detail', 'sync_to_toutiao',
         'enterprise_user_info', 'commerce_user_info', 'signature_language',
-    ]
-    for key in useless_keys:
-        user.pop(key)
-    useless_keys_opt = [
+    ],
+    drop_opt=[
         'commerce_info', 'card_entries', 'signature_extra',
         'account_info_url', 'iso_country_code', 'official_cooperation',
         'im_primary_role_id', 'im_role_ids', 'role_id',
-    ]
-    for key in useless_keys_opt:
-        user.pop(key, None)
+    ],
+    consts=DICT_CMP_USER,
+    rename={'remark_name': 'username'},
+)
+
+
+def parse_user(r: httpx.Response, strict: bool = None):
+    """
+    strict mode checks the profile against what is known of the api,
+    otherwise unexpected values are collected into unknown_fields
+    """
+    strict = STRICT if strict is None else strict
+    # process js
+    js = response_json(r)
+    if strict:
+        assert js.pop('status_code') == 0
+        assert js.pop('status_msg') is None
+        extra = js.pop('extra')
+        assert js.pop('log_pb') == {'impr_id': extra.pop('logid')}
+        assert extra.pop('fatal_item_ids') == []
+        assert list(extra.keys()) == ['now']
+        assert list(js.keys()) == ['user']
+
+    # process user
+    if strict and 'remark_name' in js['user']:
+        assert 'username' not in js['user']
+    user, not_match = USER_SCHEMA.apply(js['user'], strict)
+    unknown = {}
+    # process avatar
+    avatar = user.pop('avatar_larger')['url_list']
+    if strict:
+        assert len(avatar) == 1
+        assert 'avatar' not in user
+    user['avatar'] = avatar[0].split('?')[0]
 
     # process short_id
     if (short_id := user.pop('short_id')) != '0':
-        assert user['unique_id'] == ''
-        assert short_id.isdigit()
+        if strict:
+            assert user['unique_id'] == ''
+            assert short_id.isdigit()
         user['unique_id'] = short_id
 
     # process ip_location
     if ip := user.pop('ip_location', None):
-        assert ip.startswith('IP属地：')
-        assert 'ip' not in user
+        if strict:
+            assert ip.startswith('IP属地：')
+            assert 'ip' not in user
         user['ip'] = ip.removeprefix('IP属地：')
 
     # process location
     locs = [user.pop('province', None), user.pop(
         'city', None), user.pop('district', None)]
     if (location := user.pop('country', None)) == '中国':
-        assert any(locs)
+        if strict:
+            assert any(locs)
         if locs[0] == locs[1]:
             locs[0] = None
         location = ''.join(loc for loc in locs if loc)
-    assert 'location' not in user
+    if strict:
+        assert 'location' not in user
     user['location'] = location
 
     # process age
     age = user.pop('user_age')
     if (b := user.pop('birthday_hide_level')) == 1:
-        assert age == -1
+        if strict:
+            assert age == -1
     else:
-        assert b == 0
-        assert 'age' not in user
+        if strict:
+            assert b == 0
+            assert 'age' not in user
         if age != -1:
-            assert age > 0
+            if strict:
+                assert age > 0
             user['age'] = age
     # process id
-    assert 'id' not in user
+    if strict:
+        assert 'id' not in user
     user['id'] = int(user.pop('uid'))
 
     # process homepage
-    assert 'homepage' not in user
+    if strict:
+        assert 'homepage' not in user
     user['homepage'] = f'https://douyin.com/user/{user["sec_uid"]}'
 
     if (d := user.pop('general_permission', None)):
-        assert d == {'following_follower_list_toast': 1}
+        if d != {'following_follower_list_toast': 1}:
+            if strict:
+                raise ValueError(d)
+            unknown['general_permission'] = d
         follow_list_toast = 1
     else:
         follow_list_toast = 0
-    assert 'follow_list_toast' not in user
+    if strict:
+        assert 'follow_list_toast' not in user
     user['follow_list_toast'] = follow_list_toast
 
     if (u := user.pop('user_permissions', None)):
-        assert len(u) == 1 and len(u[0]) == 2
-        u = u[0]
-        assert u['key'] == 'douplus_user_type'
-        assert 'douplus_user_type' not in user
-        user['douplus_user_type'] = int(u['value'])
-    assert user.pop('favorite_permission') == 1 - user['show_favorite_list']
+        if strict:
+            assert len(u) == 1 and len(u[0]) == 2
+            assert u[0]['key'] == 'douplus_user_type'
+            assert 'douplus_user_type' not in user
+        user['douplus_user_type'] = int(u[0]['value'])
+    favorite_permission = user.pop('favorite_permission')
+    if strict:
+        assert favorite_permission == 1 - user['show_favorite_list']
 
     # process living
-    if (lstatus := user.pop('live_status')) == 0:
-        assert user.pop('room_id') == 0
+    lstatus, room_id = user.pop('live_status'), user.pop('room_id')
+    if lstatus == 0:
+        if strict:
+            assert room_id == 0
     else:
-        assert lstatus == 1
-        assert user.pop('room_id') == int(user.pop('room_id_str')) > 0
-        assert user.pop('room_data')
+        room_id_str, room_data = user.pop('room_id_str'), user.pop('room_data')
+        if strict:
+            assert lstatus == 1
+            assert room_id == int(room_id_str) > 0
+            assert room_data
         console.log('🎀 find living: '
                     f'[link={user["homepage"]}]{user["nickname"]}[/link]',
                     style='green on dark_green')
 
-    not_match = {}
-    for k, v in DICT_CMP_USER.items():
-
-        if user.get(k) != v:
-            not_match[k] = (user.get(k), v)
-        else:
-            assert user.pop(k) == v
     if not_match:
         console.log(
             f'{user["homepage"]}: not matching=>{not_match}', style='error')
     # process following info
     follow_status = user.pop('follow_status')
     follower_status = user.pop('follower_status')
-    if follow_status == 2:
+    if strict and follow_status == 2:
         assert follower_status == 1
-    else:
+    elif strict:
         assert follower_status in [0, 1]
         assert follow_status in [0, 1]
-    assert 'following' not in user
-    assert 'followed' not in user
+    if strict:
+        assert 'following' not in user
+        assert 'followed' not in user
     user['following'] = bool(follow_status)
     user['followed'] = bool(follower_status)
 
     if not user['following']:
-        assert user.pop('follow_guide') is True
+        follow_guide = user.pop('follow_guide', None)
+        if strict:
+            assert follow_guide is True
     else:
-        assert user.pop('is_top') == 0
+        is_top = user.pop('is_top', None)
+        if strict:
+            assert is_top == 0
 
-    if remark := user.pop('remark_name', None):
-        assert 'username' not in user
-        user['username'] = remark
     reorder = [
         'id', 'sec_uid', 'unique_id', 'username', 'nickname',  'signature',
         'school_name', 'age', 'gender', 'following', 'following_count',
@@ -171,4 +211,8 @@ def parse_user(r: httpx.Response):
     user2 = {k: user[k] for k in user if k not in reorder}
     user = user1 | user2
 
-    return {k: v for k, v in user.items() if v not in [None, '', [], '{}', '0']}
+    user = {k: v for k, v in user.items()
+            if v not in [None, '', [], '{}', '0']}
+    if unknown:
+        user['unknown_fields'] = unknown
+    return user
@@ -0,0 +1,370 @@
+import atexit
+import itertools
+import os
+import queue
+import re
+import struct
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from aweme import console
+
+PARAMS = ['-overwrite_original', '-ignoreMinorErrors', '-escapeHTML']
+
+NAMESPACES = {
+    'exif': 'http://ns.adobe.com/exif/1.0/',
+    'tiff': 'http://ns.adobe.com/tiff/1.0/',
+    'photoshop': 'http://ns.adobe.com/photoshop/1.0/',
+    'Iptc4xmpCore': 'http://iptc.org/std/Iptc4xmpCore/1.0/xmlns/',
+    'plus': 'http://ns.useplus.org/ldf/xmp/1.0/',
+    'prism': 'http://prismstandard.org/namespaces/basic/3.0/',
+}
+# exiftool tag name: (prefix, property, (struct property, container))
+XMP_TAGS = {
+    'ImageUniqueID': ('exif', 'ImageUniqueID', None),
+    'Artist': ('tiff', 'Artist', None),
+    'DateCreated': ('photoshop', 'DateCreated', None),
+    'Location': ('Iptc4xmpCore', 'Location', None),
+    'BlogTitle': ('prism', 'blogTitle', None),
+    'BlogURL': ('prism', 'blogURL', None),
+    'SeriesNumber': ('prism', 'seriesNumber', None),
+    'URLUrl': ('prism', 'url', ('url', 'Bag')),
+    'ImageCreatorID': ('plus', 'ImageCreatorID', ('ImageCreator', 'Seq')),
+    'ImageCreatorName': ('plus', 'ImageCreatorName', ('ImageCreator', 'Seq')),
+    'ImageSupplierID': ('plus', 'ImageSupplierID', ('ImageSupplier', 'Seq')),
+    'ImageSupplierName': (
+        'plus', 'ImageSupplierName', ('ImageSupplier', 'Seq')),
+}
+# files written in one round trip to an exiftool process
+BATCH_SIZE = 16
+# uuid of the box holding XMP in ISO base media files
+XMP_UUID = bytes.fromhex('be7acfcb97a942e89c71999491e3afac')
+
+
+class ExifToolPool:
+    """
+    a few exiftool processes kept running in -stay_open mode and handed
+    out to the download threads, instead of one process per file
+    """
+
+    def __init__(self, size: int = 3):
+        self.size = size
+        self._idle = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        from exiftool import ExifToolHelper
+        et = ExifToolHelper()
+        et.run()
+        return et
+
+    @contextmanager
+    def acquire(self):
+        try:
+            et = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if spawn := self._started < self.size:
+                    self._started += 1
+            try:
+                et = self._start() if spawn else self._idle.get()
+            except BaseException:
+                if spawn:
+                    with self._lock:
+                        self._started -= 1
+                raise
+        try:
+            yield et
+        finally:
+            if et.running:
+                self._idle.put(et)
+            else:
+                with self._lock:
+                    self._started -= 1
+
+    def close(self):
+        while True:
+            try:
+                et = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            et.terminate()
+            with self._lock:
+                self._started -= 1
+
+
+pool = ExifToolPool()
+
+
+def _escape(tags: dict) -> dict:
+    return {k: v.replace('\n', '&#x0a;') if isinstance(v, str) else v
+            for k, v in tags.items()}
+
+
+def _fix_suffix(img: Path, ext: str) -> Path:
+    if (suffix := f'.{ext.lower()}') != img.suffix:
+        new_img = img.with_suffix(suffix)
+        console.log(
+            f'{img}: suffix is not right, moving to {new_img}...',
+            style='error')
+        img = img.rename(new_img)
+    return img
+
+
+def _write_one(et, img: Path, tags: dict) -> Path:
+    ext = et.get_tags(img, 'File:FileTypeExtension')[
+        0]['File:FileTypeExtension']
+    img = _fix_suffix(img, ext)
+    et.set_tags(img, tags, params=PARAMS)
+    return img
+
+
+def _write_batch(et, items: list[list]) -> list:
+    """
+    one round trip for all [img, tags] items: the file types are read
+    in one command, the tags written by one command per file, chained
+    with -execute and each followed by its exit status on stderr.
+    A renamed img is updated in its item. Return the written path or
+    the error of each item.
+    """
+    from exiftool import ExifTool
+    from exiftool.exceptions import ExifToolExecuteError
+    exts = {Path(d['SourceFile']): d['File:FileTypeExtension']
+            for d in et.get_tags([img for img, _ in items],
+                                 'File:FileTypeExtension')}
+    for item in items:
+        item[0] = _fix_suffix(item[0], exts[item[0]])
+    imgs = [img for img, _ in items]
+    commands = []
+    for i, (img, (_, tags)) in enumerate(zip(imgs, items)):
+        command = [*PARAMS, *(f'-{k}={v}' for k, v in tags.items()),
+                   str(img), '-echo4', f'=${{status}}=item{i}']
+        commands.append(command)
+        if i < len(items) - 1:
+            command.append('-execute')
+    ExifTool.execute(et, *itertools.chain(*commands))
+    stderr = et.last_stderr
+    results, start = [], 0
+    for m in re.finditer(r'=(\d+)=item(\d+)', stderr):
+        if int(m.group(2)) != len(results):
+            raise ValueError(f'exiftool batch out of order: {stderr}')
+        if status := int(m.group(1)):
+            results.append(ExifToolExecuteError(
+                status, '', stderr[start:m.start()].strip(),
+                commands[len(results)]))
+        else:
+            results.append(imgs[len(results)])
+        start = m.end()
+    if len(results) != len(items):
+        raise ValueError(f'exiftool batch incomplete: {stderr}')
+    return results
+
+
+class XmpBatcher:
+    """
+    exiftool writes of the download threads, queued and sent to the
+    pool up to `batch_size` at a time: whatever queued up while the
+    processes were busy goes out in one round trip
+    """
+
+    def __init__(self, pool: ExifToolPool, batch_size: int = BATCH_SIZE):
+        self.pool = pool
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def write(self, img: Path, tags: dict) -> Path:
+        """write tags into img, return its path, renamed if needed"""
+        with self._lock:
+            if not self._workers:
+                self._workers = [
+                    threading.Thread(target=self._work, daemon=True)
+                    for _ in range(self.pool.size)]
+                for t in self._workers:
+                    t.start()
+        future = Future()
+        self._queue.put((img, _escape(tags), future))
+        return future.result()
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.pool.acquire() as et:
+                    results = self._write(et, batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            for (*_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    @staticmethod
+    def _write(et, batch: list) -> list:
+        items = [[img, tags] for img, tags, _ in batch]
+        if len(items) > 1:
+            try:
+                return _write_batch(et, items)
+            except Exception as e:
+                # a missing file or an unexpected answer fails the whole
+                # batch, write one by one to get the error of each file
+                console.log(f'exiftool batch of {len(batch)} failed ({e!r}), '
+                            'writing them one by one', style='warning')
+        results = []
+        for img, tags in items:
+            try:
+                results.append(_write_one(et, img, tags))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+batcher = XmpBatcher(pool)
+
+
+def write_xmp(img: Path, tags: dict) -> Path:
+    return batcher.write(img, tags)
+
+
+def xmp_packet(tags: dict) -> bytes | None:
+    """
+    the XMP packet of tags written by exiftool as XMP:<name>,
+    None if some tag is not known here
+    """
+    props, structs = [], {}
+    for key, value in tags.items():
+        group, _, name = key.rpartition(':')
+        if group != 'XMP' or name not in XMP_TAGS:
+            return
+        prefix, prop, in_struct = XMP_TAGS[name]
+        value = escape(str(value)).replace('\n', '&#xA;')
+        if name == 'DateCreated':
+            date, _, hms = value.partition(' ')
+            value = date.replace(':', '-') + (hms and f'T{hms}')
+        field = f'<{prefix}:{prop}>{value}</{prefix}:{prop}>'
+        if in_struct:
+            structs.setdefault((prefix, *in_struct), []).append(field)
+        else:
+            props.append(field)
+    for (prefix, prop, container), fields in structs.items():
+        props.append(
+            f'<{prefix}:{prop}><rdf:{container}>'
+            f'<rdf:li rdf:parseType="Resource">{"".join(fields)}</rdf:li>'
+            f'</rdf:{container}></{prefix}:{prop}>')
+    xmlns = ' '.join(f'xmlns:{k}="{v}"' for k, v in NAMESPACES.items())
+    return (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        f'<rdf:Description rdf:about="" {xmlns}>{"".join(props)}'
+        '</rdf:Description></rdf:RDF></x:xmpmeta>'
+        '<?xpacket end="w"?>').encode()
+
+
+def _chunk(fourcc: bytes, data: bytes) -> bytes:
+    return fourcc + struct.pack('<I', len(data)) + data + b'\0' * (
+        len(data) & 1)
+
+
+def _webp_canvas(fourcc: bytes, data: bytes) -> tuple[int, int, bool]:
+    """canvas width, height and alpha of a simple (VP8/VP8L) webp"""
+    if fourcc == b'VP8 ':
+        assert data[3:6] == b'\x9d\x01\x2a'
+        width, height = struct.unpack('<HH', data[6:10])
+        return width & 0x3fff, height & 0x3fff, False
+    assert data[0] == 0x2f
+    bits = int.from_bytes(data[1:5], 'little')
+    return ((bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1,
+            bool(bits >> 28 & 1))
+
+
+def write_webp_xmp(img: Path, packet: bytes) -> bool:
+    """add an XMP chunk to a webp without XMP, False if not possible"""
+    with img.open('r+b') as fp:
+        riff = fp.read(12)
+        if riff[:4] != b'RIFF' or riff[8:] != b'WEBP':
+            return False
+        fourcc = fp.read(8)[:4]
+        if fourcc == b'VP8X':
+            flags = fp.read(1)[0]
+            if flags & 0x04:
+                return False
+            # extended format: flag XMP and append the chunk
+            fp.seek(20)
+            fp.write(bytes([flags | 0x04]))
+            fp.seek(0, os.SEEK_END)
+            fp.write(_chunk(b'XMP ', packet))
+            fp.seek(4)
+            fp.write(struct.pack('<I', fp.seek(0, os.SEEK_END) - 8))
+            return True
+        if fourcc not in (b'VP8 ', b'VP8L'):
+            return False
+        fp.seek(12)
+        chunks = fp.read()
+    # simple format: the VP8X header has to go in front of the image
+    width, height, alpha = _webp_canvas(fourcc, chunks[8:8 + 10])
+    vp8x = _chunk(b'VP8X', bytes([0x04 | (0x10 if alpha else 0), 0, 0, 0])
+                  + (width - 1).to_bytes(3, 'little')
+                  + (height - 1).to_bytes(3, 'little'))
+    body = b'WEBP' + vp8x + chunks + _chunk(b'XMP ', packet)
+    tmp = img.with_name(img.name + '.tmp')
+    tmp.write_bytes(b'RIFF' + struct.pack('<I', len(body)) + body)
+    os.replace(tmp, img)
+    return True
+
+
+def write_mp4_xmp(img: Path, packet: bytes) -> bool:
+    """
+    append a top level XMP uuid box to an mp4 without one, which moves
+    no sample data so the chunk offsets stay valid
+    """
+    with img.open('r+b') as fp:
+        end = fp.seek(0, os.SEEK_END)
+        pos = 0
+        while pos < end:
+            fp.seek(pos)
+            size, box = struct.unpack('>I4s', fp.read(8))
+            if pos == 0 and box != b'ftyp':
+                return False
+            if box == b'ftyp' and fp.read(4) not in (
+                    b'isom', b'iso2', b'mp41', b'mp42', b'avc1', b'dash'):
+                return False
+            if box == b'uuid':
+                fp.seek(pos + 8)
+                if fp.read(16) == XMP_UUID:
+                    return False
+            if size == 1:
+                fp.seek(pos + 8)
+                size = struct.unpack('>Q', fp.read(8))[0]
+            if size < 8:
+                return False
+            pos += size
+        if pos != end:
+            return False
+        fp.seek(end)
+        fp.write(struct.pack('>I4s', 24 + len(packet), b'uuid')
+                 + XMP_UUID + packet)
+    return True
+
+
+def tag_media(img: Path, tags: dict):
+    """
+    write tags into webp and mp4 files directly,
+    other formats and tags go through exiftool
+    """
+    writer = {'.webp': write_webp_xmp, '.mp4': write_mp4_xmp}.get(img.suffix)
+    if writer and (packet := xmp_packet(tags)) and writer(img, packet):
+        return
+    write_xmp(img, tags)
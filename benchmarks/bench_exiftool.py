@@ -0,0 +1,67 @@
+"""
+files tagged per second by write_xmp with one exiftool process per file
+(the old behavior), with the pool of long-lived processes one file per
+round trip, and with the writes queued and batched (write_xmp)
+
+    python benchmarks/bench_exiftool.py sample.webp [-n 50] [--threads 10]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from aweme.xmp import PARAMS, XmpBatcher, _escape, pool, write_xmp
+
+TAGS = {
+    'XMP:ImageUniqueID': '7300000000000000000',
+    'XMP:ImageSupplierID': '100000000',
+    'XMP:ImageSupplierName': 'Aweme',
+    'XMP:ImageCreatorName': 'someone',
+    'XMP:BlogTitle': 'title\nwith two lines',
+    'XMP:BlogURL': 'https://www.douyin.com/note/7300000000000000000',
+    'XMP:DateCreated': '2023:11:01 12:00:00',
+}
+
+
+def write_xmp_per_process(img: Path, tags: dict):
+    from exiftool import ExifToolHelper
+    with ExifToolHelper() as et:
+        et.get_tags(img, 'File:FileTypeExtension')
+        et.set_tags(img, _escape(tags), params=PARAMS)
+
+
+def bench(name, write, files, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda f: write(f, TAGS.copy()), files))
+    elapsed = time.perf_counter() - start
+    print(f'{name:>8}: {len(files) / elapsed:8.1f} files/s '
+          f'({elapsed / len(files) * 1000:.1f} ms/file)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sample', type=Path)
+    parser.add_argument('-n', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def copies(name):
+            files = [Path(tmp) / f'{name}{i}{args.sample.suffix}'
+                     for i in range(args.n)]
+            for f in files:
+                shutil.copy(args.sample, f)
+            return files
+        bench('process', write_xmp_per_process, copies('process'),
+              args.threads)
+        bench('pool', XmpBatcher(pool, batch_size=1).write, copies('pool'),
+              args.threads)
+        bench('batched', write_xmp, copies('batched'), args.threads)
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+import time of the CLI entry point, measured with `python -X importtime`
+
+    python benchmarks/bench_import.py [--module aweme.script] [--budget-ms 400]
+
+exits non-zero if a module which should only be imported on first use
+shows up, or if the total import time is over budget
+"""
+import argparse
+import subprocess
+import sys
+
+# imported lazily, on first use only
+LAZY_MODULES = ['selenium', 'bs4', 'exiftool', 'geopy', 'execjs',
+                'photosinfo', 'peewee']
+
+
+def importtime(module: str) -> dict[str, int]:
+    """cumulative import time in microseconds of every imported module"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='aweme.script')
+    parser.add_argument('--budget-ms', type=float)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('-n', type=int, default=5,
+                        help='runs, the fastest one is reported')
+    args = parser.parse_args()
+
+    runs = [importtime(args.module) for _ in range(args.n)]
+    times = min(runs, key=lambda t: t[args.module])
+    total = times[args.module] / 1000
+    print(f'import {args.module}: {total:.1f} ms (best of {args.n})')
+    for name, us in sorted(times.items(), key=lambda x: -x[1])[:args.top]:
+        print(f'{us/1000:10.1f} ms  {name}')
+
+    failed = False
+    if eager := [m for m in LAZY_MODULES
+                 if any(n == m or n.startswith(f'{m}.') for n in times)]:
+        print(f'imported eagerly: {eager}')
+        failed = True
+    if args.budget_ms and total > args.budget_ms:
+        print(f'over budget: {total:.1f} ms > {args.budget_ms} ms')
+        failed = True
+    sys.exit(failed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+bytes per second decoded and stored for a corpus of raw aweme payloads,
+one json file each (see bench_parse.py --export)
+
+    python benchmarks/bench_json.py corpus/ [-n 20] [--no-orjson]
+
+stdlib is how payloads were handled before: json.loads, a sorted copy
+by sort_dict, then json.dumps of the copy. codec is aweme.codec, which
+sorts keys while encoding and uses orjson when it is installed.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from aweme import codec
+
+
+def sort_dict(d):
+    if isinstance(d, dict):
+        return {k: sort_dict(v) if isinstance(v, (dict, list)) else v for k, v in sorted(d.items())}
+    elif isinstance(d, list):
+        return [sort_dict(item) if isinstance(item, (dict, list)) else item for item in d]
+    else:
+        return d
+
+
+def bench(name, func, items, n, nbytes) -> list:
+    start = time.perf_counter()
+    for _ in range(n):
+        results = [func(item) for item in items]
+    elapsed = time.perf_counter() - start
+    print(f'{name:>20}: {n * nbytes / elapsed / 2**20:8.1f} MiB/s '
+          f'({elapsed / n / len(items) * 1e6:.1f} us/payload)')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus', type=Path)
+    parser.add_argument('-n', type=int, default=20)
+    parser.add_argument('--no-orjson', action='store_true',
+                        help='time the stdlib fallback of the codec')
+    args = parser.parse_args()
+    if args.no_orjson:
+        codec.orjson = None
+    raws = [f.read_bytes() for f in sorted(args.corpus.glob('*.json'))]
+    nbytes = sum(map(len, raws))
+    print(f'{len(raws)} payloads, {nbytes / 2**10:.0f} KiB, '
+          f'orjson: {codec.orjson is not None}')
+
+    old = bench('stdlib decode', lambda b: sort_dict(json.loads(b)),
+                raws, args.n, nbytes)
+    new = bench('codec decode', codec.loads, raws, args.n, nbytes)
+    stored = bench('stdlib store', lambda d: json.dumps(d).encode(),
+                   old, args.n, nbytes)
+    bench('codec store', lambda d: codec.dumps_sorted(d).encode(),
+          new, args.n, nbytes)
+
+    # same documents, stored with the same key order
+    for s, d in zip(stored, new):
+        assert json.loads(s) == d
+        assert json.loads(s) == json.loads(codec.dumps_sorted(d))
+        assert list(json.loads(s)) == list(json.loads(codec.dumps_sorted(d)))
+
+
+if __name__ == '__main__':
+    main()
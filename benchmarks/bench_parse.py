@@ -0,0 +1,80 @@
+"""
+parse_aweme over a corpus of raw aweme payloads, one json file each
+
+    python benchmarks/bench_parse.py corpus/ --export 500  # from Cache
+    python benchmarks/bench_parse.py corpus/ --write-golden
+    python benchmarks/bench_parse.py corpus/ [-n 20]
+
+golden.pickle holds the parse results of the parser it was written with,
+later runs check that the results are the same and the input unchanged.
+It only guards a local corpus between runs: equivalence with the
+baseline parser is tested by tests/test_parse.py.
+Run with AWEME_PARSE_MODE=fast to time the parser without validation.
+The deepcopy line is the cost of the copy the parser used to start with.
+"""
+import argparse
+import json
+import pickle
+import time
+from copy import deepcopy
+from pathlib import Path
+
+from aweme.post import parse_aweme
+
+
+def export(corpus: Path, limit: int):
+    from aweme.model import Cache
+    corpus.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for cache in Cache.select().limit(limit):
+        for kind in ['from_page', 'from_timeline']:
+            if payload := getattr(cache, kind):
+                (corpus / f'{cache.id}_{kind}.json').write_text(
+                    json.dumps(payload, ensure_ascii=False))
+                count += 1
+    print(f'exported {count} payloads to {corpus}')
+
+
+def bench(name, func, payloads, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        for payload in payloads:
+            func(payload)
+    elapsed = time.perf_counter() - start
+    total = n * len(payloads)
+    print(f'{name:>18}: {total / elapsed:10.1f} awemes/s '
+          f'({elapsed / total * 1e6:.1f} us/aweme)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus', type=Path)
+    parser.add_argument('-n', type=int, default=20)
+    parser.add_argument('--export', type=int, metavar='LIMIT')
+    parser.add_argument('--write-golden', action='store_true')
+    args = parser.parse_args()
+    if args.export:
+        export(args.corpus, args.export)
+        return
+
+    files = sorted(args.corpus.glob('*.json'))
+    payloads = [json.loads(f.read_text()) for f in files]
+    originals = deepcopy(payloads)
+    results = {f.name: parse_aweme(p) for f, p in zip(files, payloads)}
+    assert payloads == originals, 'parse_aweme changed its input'
+    golden = args.corpus / 'golden.pickle'
+    if args.write_golden:
+        golden.write_bytes(pickle.dumps(results))
+        print(f'wrote {len(results)} results to {golden}')
+    elif golden.exists():
+        expected = pickle.loads(golden.read_bytes())
+        if diff := [k for k in expected if results.get(k) != expected[k]]:
+            raise SystemExit(f'{len(diff)} results differ: {diff[:10]}')
+        print(f'{len(expected)} results match {golden}')
+
+    bench('parse_aweme', parse_aweme, payloads, args.n)
+    bench('deepcopy', deepcopy, payloads, args.n)
+
+
+if __name__ == '__main__':
+    main()
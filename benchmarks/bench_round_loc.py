@@ -0,0 +1,77 @@
+"""
+round_loc against the geodesic search it replaced, on random points
+with 3 to 8 decimals in the range of China
+
+    python benchmarks/bench_round_loc.py [-n 2000] [--seed 0]
+
+checks that round_loc and round_locs (numpy) both return exactly what
+the geodesic search does
+"""
+import argparse
+import itertools
+import random
+import time
+
+from aweme import console
+from aweme.helper import _round_loc, round_loc, round_locs
+
+TOLERANCE = 0.01
+
+
+def geodesic_round_loc(lat, lng, tolerance=TOLERANCE):
+    from geopy.distance import geodesic
+    lat, lng = float(lat), float(lng)
+    while True:
+        for precision in itertools.count(start=1):
+            lat_, lng_ = round(lat, precision), round(lng, precision)
+            if (err := geodesic((lat, lng), (lat_, lng_)).meters) < tolerance:
+                break
+        if err:
+            lat, lng = lat_, lng_
+        else:
+            break
+    return lat_, lng_
+
+
+def bench(name, func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f'{name:>16}: {elapsed / len(args[0]) * 1e6:8.2f} us/location')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    # time the search, not rich rendering the log of every moved point
+    console.log = lambda *args, **kwargs: None
+    rng = random.Random(args.seed)
+    lats, lngs = [], []
+    for _ in range(args.n):
+        digits = rng.randint(3, 8)
+        lats.append(round(rng.uniform(18, 53), digits))
+        lngs.append(round(rng.uniform(73, 135), digits))
+
+    def each(func):
+        return lambda lats, lngs: [func(*p) for p in zip(lats, lngs)]
+
+    expected = bench('geodesic', each(geodesic_round_loc), lats, lngs)
+    _round_loc.cache_clear()
+    got = bench('round_loc', each(round_loc), lats, lngs)
+    bench('round_loc (memo)', each(round_loc), lats, lngs)
+    # round_locs imports numpy on its first call, once per process
+    import numpy  # noqa: F401
+    batch = bench('round_locs', round_locs, lats, lngs)
+
+    for name, result in [('round_loc', got), ('round_locs', zip(*batch))]:
+        result = [tuple(map(float, p)) for p in result]
+        assert result == expected, (name, [
+            (p, g, e) for p, g, e in zip(zip(lats, lngs), result, expected)
+            if g != e][:5])
+    print(f'round_loc and round_locs match all {len(got)}')
+
+if __name__ == '__main__':
+    main()
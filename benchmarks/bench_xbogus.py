@@ -0,0 +1,56 @@
+"""
+signatures per second of the execjs path (one node process per call)
+and the long-lived sign worker
+
+    python benchmarks/bench_xbogus.py [-n 200]
+"""
+import argparse
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+from aweme.fetcher import UA
+from aweme.signer import XBogusSigner
+
+QUERY = urlencode({
+    'aid': '6383',
+    'count': '18',
+    'version_code': '170400',
+    'publish_video_strategy_type': '2',
+    'sec_user_id': 'MS4wLjABAAAA' + 'x' * 64,
+    'max_cursor': '1700000000000',
+})
+
+
+def bench(name, sign, n):
+    sign(QUERY, UA)  # warm up
+    start = time.perf_counter()
+    for _ in range(n):
+        sign(QUERY, UA)
+    elapsed = time.perf_counter() - start
+    print(f'{name:>8}: {n / elapsed:10.1f} signatures/s '
+          f'({elapsed / n * 1000:.2f} ms/sign)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=200)
+    args = parser.parse_args()
+
+    signer = XBogusSigner()
+    bench('worker', signer.sign, args.n)
+    signer.close()
+
+    try:
+        import execjs
+    except ImportError:
+        print('  execjs: not installed, skipped')
+        return
+    js = Path(__file__).resolve().parent.parent / 'aweme' / 'X-Bogus.js'
+    ctx = execjs.compile(js.read_text(),
+                         cwd=js.parent.parent / 'node_modules')
+    bench('execjs', lambda q, ua: ctx.call('sign', q, ua), args.n)
+
+
+if __name__ == '__main__':
+    main()
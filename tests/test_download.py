@@ -0,0 +1,41 @@
+import hashlib
+
+import httpx
+
+from aweme import download
+from aweme.cassette import Cassette, CassetteTransport
+
+URL = 'https://cdn.test/media/1.jpg'
+BODY = b'\xff\xd8\xff\xe0' + bytes(range(256)) * 64
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, content=BODY,
+                          headers={'Content-Length': str(len(BODY))})
+
+
+def _download(tmp_path, monkeypatch, transport, name):
+    monkeypatch.setattr(download, 'sess', httpx.Client(transport=transport))
+    return download.download_single_file(
+        URL, tmp_path / name, '1.jpg', filesize=len(BODY),
+        hash=hashlib.md5(BODY).hexdigest())
+
+
+def test_download_record_then_replay(tmp_path, monkeypatch):
+    cassette = Cassette(tmp_path / 'cassette', 'record')
+    recorded = _download(tmp_path, monkeypatch,
+                         CassetteTransport(cassette, httpx.MockTransport(
+                             handler)), 'record')
+    cassette.close()
+
+    def offline(request):
+        raise AssertionError('replay went to the network')
+
+    cassette = Cassette(tmp_path / 'cassette', 'replay')
+    replayed = _download(tmp_path, monkeypatch,
+                         CassetteTransport(cassette, httpx.MockTransport(
+                             offline)), 'replay')
+    for entry in (recorded, replayed):
+        assert entry['size'] == len(BODY)
+        assert entry['hash'] == hashlib.md5(BODY).hexdigest()
+    assert (tmp_path / 'replay' / '1.jpg').read_bytes() == BODY
@@ -0,0 +1,46 @@
+import httpx
+import pytest
+from furl import furl
+
+from aweme.fetcher import Fetcher
+from aweme.httpcache import ResponseCache
+
+PROFILE_URL = 'https://www.douyin.com/aweme/v1/web/user/profile/other/'
+
+
+@pytest.fixture
+def fetcher(tmp_path, monkeypatch):
+    fetcher = Fetcher()
+    fetcher.cache = ResponseCache(tmp_path / 'responses.sqlite')
+    fetcher.enable_pause = False
+    monkeypatch.setattr(fetcher, '_get_xbogus', lambda params: 'signed')
+    fetcher.requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        fetcher.requests.append(request)
+        return httpx.Response(200, json={'user': {'uid': '1'}})
+
+    fetcher.pool.main.client = httpx.Client(
+        transport=httpx.MockTransport(handler))
+    return fetcher
+
+
+def test_int_args_are_served_from_cache(fetcher):
+    for _ in range(2):
+        r = fetcher.get(PROFILE_URL, params={'user_id': 1}, alt_login=False)
+        assert r.json() == {'user': {'uid': '1'}}
+    assert len(fetcher.requests) == 1
+
+
+def test_refresh_bypasses_cache(fetcher):
+    fetcher.get(PROFILE_URL, params={'user_id': 1}, alt_login=False)
+    fetcher.get(PROFILE_URL, params={'user_id': 1}, alt_login=False,
+                refresh=True)
+    assert len(fetcher.requests) == 2
+
+
+def test_key_ignores_volatile_args_and_arg_types():
+    url = furl(PROFILE_URL)
+    url.args |= {'user_id': 1, 'X-Bogus': 'a'}
+    signed = furl(PROFILE_URL + '?X-Bogus=b&user_id=1')
+    assert ResponseCache.key(url, 'main') == ResponseCache.key(signed, 'main')